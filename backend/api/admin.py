@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Document, ChatSession, ChatMessage, SystemPrompt
+from .models import Document, Chunk, ChatSession, ChatMessage, SystemPrompt
 
 
 from django.utils.html import format_html
@@ -21,6 +21,14 @@ class DocumentAdmin(admin.ModelAdmin):
     delete_link.short_description = 'Delete'
 
 
+@admin.register(Chunk)
+class ChunkAdmin(admin.ModelAdmin):
+    list_display = ['vector_id', 'document', 'ordinal', 'page', 'created_at']
+    list_filter = ['document__user']
+    search_fields = ['vector_id', 'document__original_filename']
+    raw_id_fields = ['document']
+
+
 @admin.register(ChatSession)
 class ChatSessionAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'title', 'created_at', 'updated_at']
@@ -0,0 +1,123 @@
+"""
+Compare the in-memory BM25 keyword leg with Postgres full-text search.
+
+Both run over the same chunks (a user's rows in the Chunk registry): the BM25
+index is built in memory from the stored chunk text, as each process does on
+first use, and the Postgres backend queries the indexed search_vector column.
+Reports the BM25 build cost, per-query latency of each backend and how much
+their top-k results overlap.
+
+Queries come from --query, or are sampled from the user's own chunks.
+"""
+
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from langchain_core.documents import Document as LangchainDocument
+
+from api.models import Chunk
+from rag.hybrid_search import BM25Index, chunk_key, tokenize
+from rag.keyword_backends import PostgresKeywordIndex, is_postgres_search_available
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = "Benchmark in-memory BM25 against Postgres full-text keyword search"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, required=True,
+                            help='User whose chunks are searched')
+        parser.add_argument('--query', action='append', default=[],
+                            help='Query to run (repeatable); default samples queries from chunks')
+        parser.add_argument('--samples', type=int, default=50,
+                            help='Number of sampled queries when --query is not given')
+        parser.add_argument('--terms', type=int, default=4,
+                            help='Words per sampled query')
+        parser.add_argument('--k', type=int, default=10,
+                            help='Results per query')
+        parser.add_argument('--runs', type=int, default=3,
+                            help='Timed runs per query and backend (best run is kept)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if not is_postgres_search_available():
+            raise CommandError("Postgres full-text search needs a PostgreSQL database")
+
+        user_id, k = options['user'], options['k']
+        rows = list(
+            Chunk.objects.filter(document__user_id=user_id)
+            .values_list('vector_id', 'content', 'metadata')
+        )
+        if not rows:
+            raise CommandError(f"User {user_id} has no registered chunks")
+        missing = Chunk.objects.filter(document__user_id=user_id, search_vector__isnull=True).count()
+        if missing:
+            self.stdout.write(self.style.WARNING(
+                f"{missing} chunks have no search_vector; reindex their documents "
+                f"with KEYWORD_BACKEND=postgres first"
+            ))
+
+        # In-memory BM25 over the same chunks, built the way each process does
+        tracemalloc.start()
+        started = time.perf_counter()
+        bm25 = BM25Index([
+            LangchainDocument(id=vector_id, page_content=content, metadata=metadata)
+            for vector_id, content, metadata in rows
+        ])
+        build_seconds = time.perf_counter() - started
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f"BM25 build: {len(rows)} chunks in {build_seconds * 1000:.1f} ms, "
+            f"peak {peak_bytes / 2 ** 20:.1f} MiB"
+        )
+
+        queries = options['query'] or self._sample_queries(rows, options)
+        postgres = PostgresKeywordIndex(user_id)
+
+        timings = {'bm25': [], 'postgres': []}
+        overlaps = []
+        for query in queries:
+            results = {}
+            for name, index in (('bm25', bm25), ('postgres', postgres)):
+                best = None
+                for _ in range(max(1, options['runs'])):
+                    started = time.perf_counter()
+                    results[name] = index.search(query, k)
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+                timings[name].append(best * 1000)
+
+            bm25_keys = {chunk_key(doc) for doc, _ in results['bm25']}
+            postgres_keys = {chunk_key(doc) for doc, _ in results['postgres']}
+            if bm25_keys or postgres_keys:
+                overlaps.append(len(bm25_keys & postgres_keys) / max(len(bm25_keys), len(postgres_keys)))
+
+        self.stdout.write(f"{len(queries)} queries, k={k}")
+        for name, values in timings.items():
+            self.stdout.write(
+                f"{name:>8}: mean {sum(values) / len(values):.2f} ms, "
+                f"p50 {_percentile(values, 50):.2f} ms, p95 {_percentile(values, 95):.2f} ms"
+            )
+        if overlaps:
+            self.stdout.write(f"Top-{k} overlap: {sum(overlaps) / len(overlaps):.2%}")
+
+    def _sample_queries(self, rows, options):
+        """Short queries made of consecutive words from random chunks."""
+        rng = random.Random(options['seed'])
+        queries = []
+        for _ in range(options['samples']):
+            tokens = tokenize(rng.choice(rows)[1])
+            if not tokens:
+                continue
+            start = rng.randrange(max(1, len(tokens) - options['terms'] + 1))
+            queries.append(" ".join(tokens[start:start + options['terms']]))
+        if not queries:
+            raise CommandError("Could not sample queries from the user's chunks")
+        return queries
@@ -0,0 +1,86 @@
+"""
+Move chunks from the shared knowbot_docs collection into per-user collections.
+
+Vectors are copied with their stored embeddings (nothing is re-embedded) and
+upserted by id, so the command can be re-run safely after an interruption.
+Set CHROMA_COLLECTION_LAYOUT=per_user (and restart the web and Celery
+processes) once it has completed.
+"""
+
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from rag.service import SHARED_COLLECTION_NAME, collection_name_for, get_chroma_client
+
+
+class Command(BaseCommand):
+    help = "Copy chunks from the shared Chroma collection into one collection per user"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Chunks read from the shared collection per request')
+        parser.add_argument('--delete-source', action='store_true',
+                            help='Remove migrated chunks from the shared collection')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many chunks each user has')
+
+    def handle(self, *args, **options):
+        client = get_chroma_client()
+        try:
+            source = client.get_collection(SHARED_COLLECTION_NAME)
+        except Exception:
+            self.stdout.write(f"No {SHARED_COLLECTION_NAME} collection, nothing to migrate")
+            return
+
+        batch_size = options['batch_size']
+        counts = defaultdict(int)
+        migrated_ids = []
+        offset = 0
+        while True:
+            batch = source.get(
+                limit=batch_size, offset=offset,
+                include=["embeddings", "documents", "metadatas"]
+            )
+            if not batch["ids"]:
+                break
+            offset += len(batch["ids"])
+
+            # Group the page by owner
+            by_user = defaultdict(lambda: {"ids": [], "embeddings": [], "documents": [], "metadatas": []})
+            for chunk_id, embedding, document, metadata in zip(
+                batch["ids"], batch["embeddings"], batch["documents"], batch["metadatas"]
+            ):
+                user_id = (metadata or {}).get("user_id")
+                if not user_id:
+                    continue
+                group = by_user[int(user_id)]
+                group["ids"].append(chunk_id)
+                group["embeddings"].append(embedding)
+                group["documents"].append(document)
+                group["metadatas"].append(metadata)
+
+            for user_id, group in by_user.items():
+                counts[user_id] += len(group["ids"])
+                if options['dry_run']:
+                    continue
+                target = client.get_or_create_collection(
+                    collection_name_for(user_id, layout='per_user'), metadata=source.metadata
+                )
+                target.upsert(**group)
+                migrated_ids.extend(group["ids"])
+
+        for user_id, count in sorted(counts.items()):
+            self.stdout.write(f"User {user_id}: {count} chunks -> {collection_name_for(user_id, layout='per_user')}")
+
+        if options['dry_run']:
+            self.stdout.write("Dry run, nothing copied")
+            return
+
+        if options['delete_source'] and migrated_ids:
+            for start in range(0, len(migrated_ids), batch_size):
+                source.delete(ids=migrated_ids[start:start + batch_size])
+            self.stdout.write(f"Removed {len(migrated_ids)} migrated chunks from {SHARED_COLLECTION_NAME}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Migrated {len(migrated_ids)} chunks for {len(counts)} users"
+        ))
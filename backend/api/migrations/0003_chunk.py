@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:17
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_chatsession_user_document_user_systemprompt_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Chunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ordinal', models.IntegerField()),
+                ('page', models.IntegerField(blank=True, null=True)),
+                ('start_index', models.IntegerField(blank=True, null=True)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('vector_id', models.CharField(max_length=64, unique=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='api.document')),
+            ],
+            options={
+                'ordering': ['document', 'ordinal'],
+                'constraints': [models.UniqueConstraint(fields=('document', 'ordinal'), name='unique_chunk_ordinal')],
+            },
+        ),
+    ]
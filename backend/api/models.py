@@ -1,8 +1,10 @@
 """
 Models for KnowBot API.
-Handles Documents, Chat Sessions, and Messages.
+Handles Documents, their indexed Chunks, Chat Sessions, and Messages.
 """
 
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils import timezone
 from django.conf import settings
@@ -47,6 +49,45 @@ class Document(models.Model):
         return f"{self.original_filename} ({self.index_status})"
 
 
+class Chunk(models.Model):
+    """
+    Registry entry for one indexed chunk of a Document.
+    
+    vector_id is the chunk's stable id in the vector store and BM25 index, so
+    deletes, reindexes and citation lookups can address chunks directly.
+    content, metadata and search_vector back the Postgres keyword search
+    backend (KEYWORD_BACKEND='postgres').
+    """
+    
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='chunks'
+    )
+    ordinal = models.IntegerField()
+    page = models.IntegerField(blank=True, null=True)
+    start_index = models.IntegerField(blank=True, null=True)
+    content_hash = models.CharField(max_length=64)  # sha256 of the chunk text
+    vector_id = models.CharField(max_length=64, unique=True)
+    content = models.TextField(blank=True, default='')
+    metadata = models.JSONField(default=dict, blank=True)
+    search_vector = SearchVectorField(blank=True, null=True)
+    
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['document', 'ordinal']
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'ordinal'], name='unique_chunk_ordinal'),
+        ]
+        indexes = [
+            GinIndex(fields=['search_vector'], name='chunk_search_vector_gin'),
+        ]
+    
+    def __str__(self):
+        return f"Chunk {self.ordinal} of document {self.document_id}"
+
+
 class ChatSession(models.Model):
     """Represents a chat session with the RAG system."""
     
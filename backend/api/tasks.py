@@ -7,8 +7,84 @@ from celery import shared_task
 from django.utils import timezone
 from pathlib import Path
 
-from .models import Document
-from rag.service import DocumentProcessor, VectorStoreManager
+from .models import Chunk, Document
+from rag.embeddings import text_hash
+from rag.hybrid_search import delete_from_bm25_index
+from rag.keyword_backends import update_search_vectors
+from rag.service import INGEST_WINDOW_SIZE, DocumentProcessor, VectorStoreManager
+
+
+def index_document(document: Document) -> int:
+    """
+    Index one document and record its chunks in the Chunk registry.
+    
+    Chunks from a previous run (reindex or task retry) are deleted first, by
+    id from the registry (metadata scans only for documents indexed before
+    the registry existed), so nothing is left behind if the document
+    now splits differently or an earlier run failed part-way. Registry rows
+    are written window by window as chunks stream into the index, so memory
+    stays proportional to INGEST_WINDOW_SIZE.
+    
+    Args:
+        document: The Document to (re)index
+        
+    Returns:
+        Number of chunks indexed
+    """
+    manager = VectorStoreManager(user_id=document.user_id)
+    old_ids = list(document.chunks.values_list('vector_id', flat=True))
+    if old_ids:
+        # Reindex, or a retry (rows are registered before each window is upserted)
+        manager.delete_from_vector_store(document.file_path, vector_ids=old_ids)
+    elif document.chunk_count:
+        # Indexed before the registry existed; only metadata scans can find its chunks
+        manager.delete_from_vector_store(document.file_path)
+    else:
+        # New document: nothing in the vector store, just guard the keyword index
+        delete_from_bm25_index(document.file_path, user_id=document.user_id)
+    document.chunks.all().delete()
+    
+    def flush(records):
+        Chunk.objects.bulk_create(records)
+        # Postgres keyword search index (no-op on other databases)
+        update_search_vectors(document.chunks.filter(
+            vector_id__in=[record.vector_id for record in records]
+        ))
+    
+    def register(chunks):
+        # Rows for a window are written before it is upserted, so the registry
+        # covers every chunk a failed run may have indexed
+        records = []
+        for chunk in chunks:
+            records.append(Chunk(
+                document=document,
+                ordinal=chunk.metadata['chunk_index'],
+                page=chunk.metadata.get('page'),
+                start_index=chunk.metadata.get('start_index'),
+                content_hash=text_hash(chunk.page_content),
+                vector_id=chunk.metadata['chunk_id'],
+                content=chunk.page_content,
+                metadata=chunk.metadata,
+            ))
+            if len(records) >= INGEST_WINDOW_SIZE:
+                flush(records)
+                records = []
+            yield chunk
+        if records:
+            flush(records)
+    
+    # Stream chunks with user context (pages are loaded lazily)
+    processor = DocumentProcessor()
+    chunks = processor.iter_chunks(
+        document.file_path,
+        user_id=document.user_id,
+        original_filename=document.original_filename
+    )
+    chunk_count = manager.index_chunks(register(chunks))
+    if not chunk_count:
+        raise ValueError("No chunks provided to create vector store")
+    
+    return chunk_count
 
 
 @shared_task(bind=True, max_retries=3)
@@ -17,8 +93,8 @@ def index_document_task(self, document_id: int):
     Async task to index a single document.
     
     This task:
-    1. Loads and chunks the document
-    2. Creates/updates the vector store for the user's collection
+    1. Streams the document's pages through chunking
+    2. Embeds and upserts the chunks into the user's collection window by window
     3. Updates document status in database
     """
     try:
@@ -34,21 +110,12 @@ def index_document_task(self, document_id: int):
     document.save()
     
     try:
-        # Load and chunk document with user context
-        processor = DocumentProcessor()
-        chunks = processor.load_single_document(
-            document.file_path, 
-            user_id=user_id,
-            original_filename=document.original_filename
-        )
-        
-        # Create/update vector store for specific user
-        manager = VectorStoreManager(user_id=user_id)
-        manager.create_vector_store(chunks)
+        # Index into the user's collection and register the chunks
+        chunk_count = index_document(document)
         
         # Update document record
         document.index_status = Document.IndexStatus.INDEXED
-        document.chunk_count = len(chunks)
+        document.chunk_count = chunk_count
         document.indexed_at = timezone.now()
         document.error_message = None
         document.save()
@@ -56,7 +123,7 @@ def index_document_task(self, document_id: int):
         return {
             'success': True,
             'document_id': document_id,
-            'chunks': len(chunks),
+            'chunks': chunk_count,
             'user_id': user_id
         }
         
@@ -74,37 +141,38 @@ def reindex_all_documents_task(self):
     """
     Async task to reindex all documents.
     Useful after a document deletion or for rebuilding the vector store.
+    Each document's previous chunks are removed by id before it is indexed again.
     """
-    from django.conf import settings
+    documents = Document.objects.filter(
+        index_status__in=[Document.IndexStatus.INDEXED, Document.IndexStatus.FAILED]
+    )
+    if not documents.exists():
+        return {'message': 'No documents to index'}
     
-    try:
-        # Load all documents from data directory
-        processor = DocumentProcessor()
-        all_chunks = processor.load_all_documents()
-        
-        if not all_chunks:
-            return {'message': 'No documents to index'}
+    total_chunks = 0
+    failed = []
+    for document in documents.iterator():
+        try:
+            chunk_count = index_document(document)
+        except Exception as e:
+            document.index_status = Document.IndexStatus.FAILED
+            document.error_message = str(e)
+            document.save()
+            failed.append(document.id)
+            continue
         
-        # Create new vector store
-        manager = VectorStoreManager()
-        manager.create_vector_store(all_chunks)
-        
-        # Update all document records
-        Document.objects.filter(
-            index_status__in=[Document.IndexStatus.INDEXED, Document.IndexStatus.FAILED]
-        ).update(
-            index_status=Document.IndexStatus.INDEXED,
-            indexed_at=timezone.now(),
-            error_message=None
-        )
-        
-        return {
-            'success': True,
-            'total_chunks': len(all_chunks)
-        }
-        
-    except Exception as e:
-        return {'error': str(e)}
+        document.index_status = Document.IndexStatus.INDEXED
+        document.chunk_count = chunk_count
+        document.indexed_at = timezone.now()
+        document.error_message = None
+        document.save()
+        total_chunks += chunk_count
+    
+    return {
+        'success': not failed,
+        'total_chunks': total_chunks,
+        'failed_documents': failed
+    }
 
 
 @shared_task
@@ -1,16 +1,22 @@
+import json
 import uuid
 import os
 from pathlib import Path
 from django.conf import settings
 from django.utils import timezone
-from django.http import FileResponse
+from django.http import FileResponse, StreamingHttpResponse
 from django.contrib.auth.models import User
 from rest_framework import status, viewsets, generics, permissions
-from rest_framework.decorators import api_view, action, permission_classes
+from rest_framework.decorators import api_view, action, permission_classes, renderer_classes
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from .models import Document, ChatSession, ChatMessage, SystemPrompt
-from rag.service import RAGEngine, DocumentProcessor, VectorStoreManager
+from rag.service import (
+    VectorStoreManager, get_rag_engine, invalidate_rag_engines
+)
+from rag.embeddings import get_query_batcher_stats
+from rag.hybrid_search import get_bm25_index_stats
 from .serializers import (
     DocumentSerializer, DocumentUploadSerializer,
     ChatSessionSerializer, ChatSessionListSerializer,
@@ -76,12 +82,10 @@ class DocumentViewSet(viewsets.ModelViewSet):
             index_document_task.delay(document.id)
         except Exception as e:
             try:
-                processor = DocumentProcessor()
-                chunks = processor.load_single_document(str(file_path), user_id=request.user.id)
-                manager = VectorStoreManager(user_id=request.user.id)
-                manager.create_vector_store(chunks)
+                from .tasks import index_document
+                chunk_count = index_document(document)
                 document.index_status = Document.IndexStatus.INDEXED
-                document.chunk_count = len(chunks)
+                document.chunk_count = chunk_count
                 document.indexed_at = timezone.now()
                 document.save()
             except Exception as sync_error:
@@ -137,6 +141,7 @@ class DocumentViewSet(viewsets.ModelViewSet):
             
             # Delete DB records
             documents.delete()
+            invalidate_rag_engines(request.user.id)
             
             return Response({'message': 'Knowledge base reset successfully'})
         except Exception as e:
@@ -147,7 +152,8 @@ class DocumentViewSet(viewsets.ModelViewSet):
         try:
             # Delete from Vector Store first
             manager = VectorStoreManager(user_id=request.user.id)
-            manager.delete_from_vector_store(document.file_path)
+            vector_ids = list(document.chunks.values_list('vector_id', flat=True))
+            manager.delete_from_vector_store(document.file_path, vector_ids=vector_ids or None)
             
             # Delete file from disk
             file_path = Path(document.file_path)
@@ -155,7 +161,9 @@ class DocumentViewSet(viewsets.ModelViewSet):
                 file_path.unlink()
         except Exception as e:
             print(f"Error deleting file/vectors: {e}")
-        return super().destroy(request, *args, **kwargs)
+        response = super().destroy(request, *args, **kwargs)
+        invalidate_rag_engines(request.user.id)
+        return response
 
 
 class ChatSessionViewSet(viewsets.ModelViewSet):
@@ -186,17 +194,11 @@ class ChatSessionViewSet(viewsets.ModelViewSet):
         return Response({'message': 'Messages cleared'})
 
 
-@api_view(['POST'])
-@permission_classes([permissions.IsAuthenticated])
-def chat(request):
-    """Main chat endpoint."""
-    serializer = ChatRequestSerializer(data=request.data)
-    if not serializer.is_valid():
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    
-    message = serializer.validated_data['message']
-    session_id = serializer.validated_data.get('session_id')
-    
+NO_DOCUMENTS_RESPONSE = "I don't have any documents to answer from yet. Please upload some documents."
+
+
+def _start_chat_turn(request, message, session_id):
+    """Resolve the session, record the user's message and load the active prompt."""
     if session_id:
         try:
             session = ChatSession.objects.get(id=session_id, user=request.user)
@@ -223,21 +225,12 @@ def chat(request):
         user=request.user, 
         index_status=Document.IndexStatus.INDEXED
     ).exists()
+    
+    return session, custom_prompt, has_docs
 
-    if not has_docs:
-        response_text = "I don't have any documents to answer from yet. Please upload some documents."
-        citations = []
-    else:
-        try:
-            engine = RAGEngine(custom_prompt=custom_prompt, user_id=request.user.id)
-            result = engine.query(message)
-            response_text = result['response']
-            citations = result['citations']
-        except Exception as e:
-            # Fallback for RAG errors
-            response_text = f"I encountered an error while searching your documents: {str(e)}"
-            citations = []
 
+def _finish_chat_turn(session, message, response_text, citations):
+    """Persist the assistant's answer and update the session."""
     ChatMessage.objects.create(
         session=session,
         role=ChatMessage.Role.ASSISTANT,
@@ -253,6 +246,36 @@ def chat(request):
         # Update timestamp
         session.updated_at = timezone.now()
         session.save()
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def chat(request):
+    """Main chat endpoint."""
+    serializer = ChatRequestSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    message = serializer.validated_data['message']
+    session_id = serializer.validated_data.get('session_id')
+    
+    session, custom_prompt, has_docs = _start_chat_turn(request, message, session_id)
+
+    if not has_docs:
+        response_text = NO_DOCUMENTS_RESPONSE
+        citations = []
+    else:
+        try:
+            engine = get_rag_engine(user_id=request.user.id, custom_prompt=custom_prompt)
+            result = engine.query(message)
+            response_text = result['response']
+            citations = result['citations']
+        except Exception as e:
+            # Fallback for RAG errors
+            response_text = f"I encountered an error while searching your documents: {str(e)}"
+            citations = []
+
+    _finish_chat_turn(session, message, response_text, citations)
     
     return Response({
         'response': response_text,
@@ -261,6 +284,118 @@ def chat(request):
     })
 
 
+class EventStreamRenderer(BaseRenderer):
+    """Lets DRF content negotiation accept `Accept: text/event-stream`."""
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Only reached for non-streaming (error) responses
+        return json.dumps(data)
+
+
+def _sse(event, data):
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class _ClosingStream:
+    """
+    Streaming body that runs on_close when Django closes the response.
+    
+    Closing a generator that never started doesn't run its finally block, so
+    a client that disconnects before the first event would otherwise skip
+    the generator's cleanup entirely.
+    """
+    
+    def __init__(self, generator, on_close):
+        self._generator = generator
+        self._on_close = on_close
+    
+    def __iter__(self):
+        return self._generator
+    
+    def close(self):
+        try:
+            self._generator.close()
+        finally:
+            self._on_close()
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+def chat_stream(request):
+    """
+    Streaming chat endpoint (server-sent events).
+    
+    Emits `session`, then `citations` as soon as retrieval finishes, then a
+    `token` event per generated delta, and finally `done` with the full
+    response. The assistant message is saved when the stream completes (or
+    with the partial answer if the client disconnects, even before the first
+    event).
+    """
+    serializer = ChatRequestSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    message = serializer.validated_data['message']
+    session_id = serializer.validated_data.get('session_id')
+    
+    session, custom_prompt, has_docs = _start_chat_turn(request, message, session_id)
+    user_id = request.user.id
+    parts = []
+    citations = []
+    saved = False
+    
+    def save_turn():
+        # Called when the stream ends and again when the response is closed
+        nonlocal saved
+        if not saved:
+            saved = True
+            _finish_chat_turn(session, message, "".join(parts), citations)
+    
+    def event_stream():
+        nonlocal parts, citations
+        try:
+            yield _sse('session', {'session_id': session.id})
+            
+            if not has_docs:
+                parts.append(NO_DOCUMENTS_RESPONSE)
+                yield _sse('token', {'content': NO_DOCUMENTS_RESPONSE})
+            else:
+                try:
+                    engine = get_rag_engine(user_id=user_id, custom_prompt=custom_prompt)
+                    for event in engine.stream(message):
+                        if event['type'] == 'citations':
+                            citations = event['citations']
+                            yield _sse('citations', {'citations': citations})
+                        else:
+                            parts.append(event['content'])
+                            yield _sse('token', {'content': event['content']})
+                except Exception as e:
+                    # Fallback for RAG errors
+                    error_text = f"I encountered an error while searching your documents: {str(e)}"
+                    parts = [error_text]
+                    citations = []
+                    yield _sse('error', {'content': error_text})
+        finally:
+            save_turn()
+        
+        yield _sse('done', {
+            'response': "".join(parts),
+            'citations': citations,
+            'session_id': session.id
+        })
+    
+    response = StreamingHttpResponse(
+        _ClosingStream(event_stream(), save_turn), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def preview_document(request, pk):
@@ -291,6 +426,15 @@ class SystemPromptViewSet(viewsets.ModelViewSet):
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+        invalidate_rag_engines(self.request.user.id)
+    
+    def perform_update(self, serializer):
+        serializer.save()
+        invalidate_rag_engines(self.request.user.id)
+    
+    def perform_destroy(self, instance):
+        instance.delete()
+        invalidate_rag_engines(self.request.user.id)
     
     @action(detail=False, methods=['get'], url_path='active')
     def get_active(self, request):
@@ -305,11 +449,13 @@ class SystemPromptViewSet(viewsets.ModelViewSet):
         prompt = self.get_object()
         prompt.is_active = True
         prompt.save()
+        invalidate_rag_engines(request.user.id)
         return Response(SystemPromptSerializer(prompt).data)
     
     @action(detail=False, methods=['post'], url_path='reset')
     def reset_to_default(self, request):
         SystemPrompt.objects.filter(is_active=True, user=request.user).update(is_active=False)
+        invalidate_rag_engines(request.user.id)
         return Response({'message': 'Reset to default prompt'})
 
 
@@ -320,5 +466,7 @@ def health_check(request):
     return Response({
         'status': 'healthy',
         'service': 'knowbot-api',
-        'timestamp': timezone.now().isoformat()
+        'timestamp': timezone.now().isoformat(),
+        'query_embedding_batches': get_query_batcher_stats(),
+        'bm25_indexes': get_bm25_index_stats()
     })
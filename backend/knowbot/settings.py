@@ -27,6 +27,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     # Third-party
     'rest_framework',
     'corsheaders',
@@ -151,6 +152,8 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+# Prefork child processes per worker (Celery's own default is the CPU count)
+CELERY_WORKER_CONCURRENCY = int(os.environ.get('CELERY_WORKER_CONCURRENCY', str(os.cpu_count() or 1)))
 
 
 # Ollama Configuration
@@ -162,5 +165,97 @@ EMBEDDING_MODEL = 'nomic-embed-text'
 # File Upload Settings
 DATA_DIR = BASE_DIR / 'data'
 CHROMA_DIR = BASE_DIR / 'chroma_db'
+# 'shared' (one collection filtered by user) or 'per_user' (one collection per user);
+# run `manage.py migrate_vector_collections` before switching an existing deployment
+CHROMA_COLLECTION_LAYOUT = os.environ.get('CHROMA_COLLECTION_LAYOUT', 'shared')
+
+# Vector backend: 'chroma', or 'numpy' for in-process search over memory-mapped
+# vectors under VECTOR_DIR (no network hop; suits small and medium tenants)
+VECTOR_BACKEND = os.environ.get('VECTOR_BACKEND', 'chroma')
+VECTOR_DIR = BASE_DIR / 'vector_index'
+NUMPY_VECTOR_DTYPE = os.environ.get('NUMPY_VECTOR_DTYPE', 'float16')  # float16, int8
+NUMPY_VECTOR_INDEX = os.environ.get('NUMPY_VECTOR_INDEX', 'flat')  # flat, ivf
+NUMPY_IVF_MIN_ROWS = int(os.environ.get('NUMPY_IVF_MIN_ROWS', '20000'))
+NUMPY_IVF_NPROBE = int(os.environ.get('NUMPY_IVF_NPROBE', '32'))
+BM25_DIR = BASE_DIR / 'bm25_index'
+# Memory budget for the BM25 indexes each process keeps loaded (LRU by user)
+BM25_INDEX_MEMORY_MB = int(os.environ.get('BM25_INDEX_MEMORY_MB', '512'))
 MAX_UPLOAD_SIZE = 50 * 1024 * 1024  # 50MB
 ALLOWED_UPLOAD_EXTENSIONS = ['.pdf', '.txt', '.md']
+
+
+# Hybrid Search (BM25 + semantic)
+HYBRID_FUSION_METHOD = os.environ.get('HYBRID_FUSION_METHOD', 'rrf')  # rrf, combsum, combmnz
+HYBRID_FETCH_K_MULTIPLIER = int(os.environ.get('HYBRID_FETCH_K_MULTIPLIER', '2'))
+HYBRID_SEMANTIC_TIMEOUT = float(os.environ.get('HYBRID_SEMANTIC_TIMEOUT', '30'))
+HYBRID_BM25_TIMEOUT = float(os.environ.get('HYBRID_BM25_TIMEOUT', '5'))
+# Keyword leg: 'bm25' (per-process in-memory index over BM25_DIR segments) or
+# 'postgres' (shared full-text search over the Chunk table, ts_rank_cd ranking).
+# search_vector is only filled while 'postgres' is active: reindex after switching.
+KEYWORD_BACKEND = os.environ.get('KEYWORD_BACKEND', 'bm25')
+KEYWORD_SEARCH_CONFIG = os.environ.get('KEYWORD_SEARCH_CONFIG', 'english')  # Postgres text search config
+
+
+# Embedding cache (content-hash keyed, shared by web and Celery processes)
+EMBEDDING_CACHE_ENABLED = os.environ.get('EMBEDDING_CACHE_ENABLED', 'True').lower() in ('true', '1', 'yes')
+EMBEDDING_CACHE_PATH = BASE_DIR / 'embedding_cache' / 'embeddings.sqlite3'
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get('EMBEDDING_CACHE_MAX_ENTRIES', '500000'))
+
+
+# Cache (Redis when available so all web workers share answer/retrieval caches)
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
+# Answer cache for /api/chat/ (exact + semantic tiers)
+ANSWER_CACHE_ENABLED = os.environ.get('ANSWER_CACHE_ENABLED', 'True').lower() in ('true', '1', 'yes')
+ANSWER_CACHE_TTL = int(os.environ.get('ANSWER_CACHE_TTL', '3600'))
+ANSWER_CACHE_SIMILARITY = float(os.environ.get('ANSWER_CACHE_SIMILARITY', '0.95'))
+
+
+# Query embedding + retrieval result caches (LRU + TTL, optionally shared via Redis)
+RETRIEVAL_CACHE_ENABLED = os.environ.get('RETRIEVAL_CACHE_ENABLED', 'True').lower() in ('true', '1', 'yes')
+RETRIEVAL_CACHE_TTL = int(os.environ.get('RETRIEVAL_CACHE_TTL', '600'))
+QUERY_EMBEDDING_CACHE_TTL = int(os.environ.get('QUERY_EMBEDDING_CACHE_TTL', '3600'))
+QUERY_CACHE_SHARED = bool(REDIS_URL)
+
+
+# Micro-batching of query embeddings across concurrent chat requests
+QUERY_EMBEDDING_BATCHING = os.environ.get('QUERY_EMBEDDING_BATCHING', 'True').lower() in ('true', '1', 'yes')
+QUERY_EMBEDDING_BATCH_WINDOW_MS = float(os.environ.get('QUERY_EMBEDDING_BATCH_WINDOW_MS', '5'))
+QUERY_EMBEDDING_BATCH_MAX_SIZE = int(os.environ.get('QUERY_EMBEDDING_BATCH_MAX_SIZE', '32'))
+QUERY_EMBEDDING_BATCH_TIMEOUT = float(os.environ.get('QUERY_EMBEDDING_BATCH_TIMEOUT', '60'))  # seconds a query waits for its batch
+
+# Indexing: chunks per embedding call and parallel embedding calls to Ollama
+INDEX_EMBED_BATCH_SIZE = int(os.environ.get('INDEX_EMBED_BATCH_SIZE', '64'))
+INDEX_EMBED_CONCURRENCY = int(os.environ.get('INDEX_EMBED_CONCURRENCY', '4'))
+
+# Streaming ingestion: chunks held in memory at once while indexing a document
+INGEST_WINDOW_SIZE = int(os.environ.get('INGEST_WINDOW_SIZE', '512'))
+
+# OCR: pages of one PDF OCR'd in parallel, and the per-worker-process cap on
+# concurrent Tesseract jobs (size of the shared OCR pool). Every prefork child
+# has its own pool, so the default splits the CPUs between them.
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS', str(min(4, os.cpu_count() or 1))))
+OCR_MAX_CONCURRENCY = int(os.environ.get(
+    'OCR_MAX_CONCURRENCY', str(max(1, (os.cpu_count() or 1) // CELERY_WORKER_CONCURRENCY))
+))
+OCR_RASTER_WINDOW = int(os.environ.get('OCR_RASTER_WINDOW', '4'))
+OCR_PAGE_MIN_CHARS = int(os.environ.get('OCR_PAGE_MIN_CHARS', '50'))
+
+# OCR cache: Tesseract output per (file hash, page, DPI, language)
+OCR_CACHE_ENABLED = os.environ.get('OCR_CACHE_ENABLED', 'True').lower() in ('true', '1', 'yes')
+OCR_CACHE_PATH = BASE_DIR / 'ocr_cache' / 'ocr.sqlite3'
+OCR_CACHE_MAX_ENTRIES = int(os.environ.get('OCR_CACHE_MAX_ENTRIES', '100000'))  # pages
@@ -0,0 +1,325 @@
+"""
+Persistent BM25 Segment Store for KnowBot 2.0
+
+Stores each user's BM25 index on disk as immutable segment files plus a small
+manifest, so the Celery worker that indexes documents and every web process
+that answers queries see the same keyword index, and restarts don't lose it.
+
+Layout (one directory per user under settings.BM25_DIR):
+    MANIFEST.json       {"generation": n, "segments": [{"name", "docs", "file_paths", "deleted"}]}
+    seg-00000001.jsonl  one JSON record per chunk: content, metadata, term freqs, length
+    .lock               advisory lock serializing writers
+
+Segments are written under a temporary name and renamed into place before the
+manifest that references them is atomically replaced, so readers only ever see
+complete segments. Readers stream segment files one record at a time.
+
+Deleting a document only records a tombstone (its file_path) on the segments
+that contain it. Segments are merged tier by tier: once BM25_MERGE_FACTOR
+segments of similar size exist, they are rewritten as one segment of the next
+tier, so each chunk is rewritten O(log N) times. Only a high tombstone ratio
+triggers a full compaction of every segment.
+"""
+
+import json
+import math
+import os
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Dict, Any, Iterator, Optional
+
+from django.conf import settings
+from langchain_core.documents import Document
+
+from rag.storage import atomic_write, exclusive_lock, file_stamp
+
+
+BM25_DIR = str(getattr(settings, 'BM25_DIR', './bm25_index'))
+MANIFEST_NAME = 'MANIFEST.json'
+LOCK_NAME = '.lock'
+
+# Compact everything once this fraction of stored chunks is tombstoned
+BM25_COMPACTION_RATIO = float(getattr(settings, 'BM25_COMPACTION_RATIO', 0.3))
+# Merge this many segments of the same size tier (docs within a factor of it) into one
+BM25_MERGE_FACTOR = max(2, int(getattr(settings, 'BM25_MERGE_FACTOR', 10)))
+
+
+class BM25SegmentStore:
+    """On-disk segment files and manifest for one user's BM25 index."""
+
+    def __init__(self, user_id: int = None, base_dir: str = BM25_DIR):
+        self.user_id = user_id
+        self.directory = Path(base_dir) / (f"user_{user_id}" if user_id else "shared")
+        self.manifest_path = self.directory / MANIFEST_NAME
+
+    def manifest_stamp(self) -> Optional[tuple]:
+        """Cheap change detector: (inode, mtime_ns, size) of the manifest, or None if absent."""
+        return file_stamp(self.manifest_path)
+
+    def read_manifest(self) -> Dict[str, Any]:
+        """Read the current manifest (an empty one if the index was never written)."""
+        try:
+            with open(self.manifest_path, 'rb') as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return {"generation": 0, "segments": []}
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        """Exclusive advisory lock so concurrent writers don't lose manifest updates."""
+        with exclusive_lock(self.directory / LOCK_NAME):
+            yield
+
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        atomic_write(self.manifest_path, json.dumps(manifest).encode('utf-8'))
+
+    def _publish_segment(self, manifest: Dict[str, Any], records: List[Dict[str, Any]]) -> str:
+        """
+        Write records as a new segment and append it to manifest (in memory).
+
+        Must be called with the write lock held; the caller writes the manifest.
+        """
+        file_paths: Dict[str, int] = Counter(
+            record["metadata"].get('file_path') or '' for record in records
+        )
+        payload = "".join(json.dumps(record, default=str) + "\n" for record in records)
+
+        generation = manifest["generation"] + 1
+        name = f"seg-{generation:08d}.jsonl"
+
+        # Segment first, then the manifest that makes it visible
+        atomic_write(self.directory / name, payload.encode('utf-8'))
+        manifest["generation"] = generation
+        manifest["segments"].append({
+            "name": name,
+            "docs": len(records),
+            "file_paths": dict(file_paths),
+            "deleted": [],
+        })
+        return name
+
+    def append(self, documents: List[Document]) -> Optional[str]:
+        """
+        Persist documents as a new segment and publish it in the manifest.
+
+        Args:
+            documents: LangChain Documents (chunks) to add
+
+        Returns:
+            Name of the new segment, or None if there was nothing to write
+        """
+        from rag.hybrid_search import tokenize
+
+        if not documents:
+            return None
+
+        records = []
+        for doc in documents:
+            tokens = tokenize(doc.page_content)
+            records.append({
+                "content": doc.page_content,
+                "metadata": doc.metadata,
+                "tf": Counter(tokens),
+                "len": len(tokens),
+            })
+
+        with self._write_lock():
+            manifest = self.read_manifest()
+            name = self._publish_segment(manifest, records)
+            self._write_manifest(manifest)
+
+        print(f"BM25 segment {name} written for user {self.user_id}: {len(documents)} chunks")
+        self.maybe_compact()
+        return name
+
+    def delete_file(self, file_path: str) -> int:
+        """
+        Tombstone every chunk of a document.
+
+        Args:
+            file_path: The document's file_path metadata value
+
+        Returns:
+            Number of chunks tombstoned
+        """
+        if self.manifest_stamp() is None:
+            return 0
+
+        deleted = 0
+        with self._write_lock():
+            manifest = self.read_manifest()
+            for segment in manifest["segments"]:
+                if file_path in segment["file_paths"] and file_path not in segment["deleted"]:
+                    segment["deleted"].append(file_path)
+                    deleted += segment["file_paths"][file_path]
+            if deleted:
+                manifest["generation"] += 1
+                self._write_manifest(manifest)
+
+        if deleted:
+            print(f"BM25 tombstoned {deleted} chunks of {file_path} for user {self.user_id}")
+            self.maybe_compact()
+        return deleted
+
+    def reset(self) -> None:
+        """Drop every segment of this index."""
+        if self.manifest_stamp() is None:
+            return
+
+        with self._write_lock():
+            manifest = self.read_manifest()
+            old_segments = [segment["name"] for segment in manifest["segments"]]
+            # Keep the generation counter so new segment names never repeat old ones
+            self._write_manifest({"generation": manifest["generation"] + 1, "segments": []})
+            self._remove_segments(old_segments)
+
+        print(f"BM25 index reset for user {self.user_id}")
+
+    def _remove_segments(self, names: List[str]) -> None:
+        for name in names:
+            try:
+                os.unlink(self.directory / name)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def needs_compaction(manifest: Dict[str, Any]) -> bool:
+        """Whether enough chunks are tombstoned to warrant a full rewrite."""
+        segments = manifest["segments"]
+        total = sum(segment["docs"] for segment in segments)
+        deleted = sum(
+            segment["file_paths"].get(path, 0)
+            for segment in segments for path in segment["deleted"]
+        )
+        return total > 0 and deleted / total >= BM25_COMPACTION_RATIO
+
+    @staticmethod
+    def merge_candidates(manifest: Dict[str, Any]) -> List[str]:
+        """
+        Oldest BM25_MERGE_FACTOR segments of the smallest full size tier.
+
+        A segment's tier is floor(log_F(docs)) for F = BM25_MERGE_FACTOR, so
+        only segments of similar size are merged together.
+
+        Returns:
+            Segment names to merge, or [] if no tier is full
+        """
+        tiers: Dict[int, List[str]] = defaultdict(list)
+        for segment in manifest["segments"]:
+            tier = int(math.log(max(segment["docs"], 1), BM25_MERGE_FACTOR))
+            tiers[tier].append(segment["name"])
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= BM25_MERGE_FACTOR:
+                return tiers[tier][:BM25_MERGE_FACTOR]
+        return []
+
+    def maybe_compact(self) -> bool:
+        """Compact if needs_compaction() says so, else merge any full size tiers."""
+        manifest = self.read_manifest()
+        if self.needs_compaction(manifest):
+            self.compact()
+            return True
+        merged = False
+        # A merge can fill the next tier up, so cascade
+        names = self.merge_candidates(manifest)
+        while names:
+            self.merge(names)
+            merged = True
+            names = self.merge_candidates(self.read_manifest())
+        return merged
+
+    def merge(self, names: List[str]) -> None:
+        """
+        Rewrite some segments as one new segment, dropping their tombstoned chunks.
+
+        The other segments are untouched, so readers only load the merged
+        segment instead of reloading the whole index.
+
+        Args:
+            names: Segment names from the manifest
+        """
+        with self._write_lock():
+            manifest = self.read_manifest()
+            wanted = set(names)
+            merging = [segment for segment in manifest["segments"] if segment["name"] in wanted]
+            if not merging:
+                return
+
+            records = []
+            for segment in merging:
+                deleted = set(segment["deleted"])
+                for record in self.iter_segment(segment["name"]):
+                    if record["metadata"].get('file_path') not in deleted:
+                        records.append(record)
+
+            manifest["segments"] = [
+                segment for segment in manifest["segments"] if segment["name"] not in wanted
+            ]
+            if records:
+                self._publish_segment(manifest, records)
+            else:
+                manifest["generation"] += 1
+            self._write_manifest(manifest)
+            self._remove_segments([segment["name"] for segment in merging])
+
+        print(f"BM25 merged {len(merging)} segments for user {self.user_id}: {len(records)} live chunks")
+
+    def compact(self) -> None:
+        """
+        Merge all segments into one, dropping tombstoned chunks.
+
+        The merged segment is published with a single manifest swap, after
+        which the old segment files are removed.
+        """
+        with self._write_lock():
+            manifest = self.read_manifest()
+            old_segments = [segment["name"] for segment in manifest["segments"]]
+            if not old_segments:
+                return
+
+            records = []
+            for segment in manifest["segments"]:
+                deleted = set(segment["deleted"])
+                for record in self.iter_segment(segment["name"]):
+                    if record["metadata"].get('file_path') not in deleted:
+                        records.append(record)
+
+            compacted = {"generation": manifest["generation"], "segments": []}
+            if records:
+                self._publish_segment(compacted, records)
+            else:
+                compacted["generation"] += 1
+            self._write_manifest(compacted)
+            self._remove_segments(old_segments)
+
+        print(f"BM25 index compacted for user {self.user_id}: "
+              f"{len(old_segments)} segments -> {len(records)} live chunks")
+
+    @classmethod
+    def all_stores(cls, base_dir: str = BM25_DIR) -> List['BM25SegmentStore']:
+        """Every per-user store found under base_dir."""
+        stores = []
+        root = Path(base_dir)
+        if root.exists():
+            for directory in sorted(root.iterdir()):
+                if (directory / MANIFEST_NAME).exists():
+                    name = directory.name
+                    user_id = int(name[len("user_"):]) if name.startswith("user_") else None
+                    stores.append(cls(user_id, base_dir=base_dir))
+        return stores
+
+    def iter_segment(self, name: str) -> Iterator[Dict[str, Any]]:
+        """
+        Stream the records of one segment, one line at a time.
+
+        Args:
+            name: Segment file name from the manifest
+
+        Yields:
+            Dicts with 'content', 'metadata', 'tf' and 'len'
+        """
+        with open(self.directory / name, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
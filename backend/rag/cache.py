@@ -0,0 +1,228 @@
+"""
+Query-Time Caches for KnowBot 2.0
+
+Answer cache for /api/chat/, stored in the Django cache (Redis when
+REDIS_URL is configured) so every web worker shares hits:
+- exact tier: normalized question -> answer + citations
+- semantic tier: questions whose embedding is close enough to a cached one;
+  a ring of ANSWER_CACHE_SEMANTIC_ENTRIES slots per scope, each holding one
+  float32 embedding and the exact-tier key of its answer, claimed with an
+  atomic counter so concurrent workers never overwrite each other's entries
+
+Entries are scoped by user, active system prompt and the user's knowledge base
+version, so indexing, deleting or resetting documents (or changing the prompt)
+makes old answers unreachable; they then expire via TTL.
+
+TTLCache is the in-process LRU+TTL layer (optionally backed by the Django
+cache) used for query embeddings and retrieval results.
+"""
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+
+ANSWER_CACHE_ENABLED = getattr(settings, 'ANSWER_CACHE_ENABLED', True)
+ANSWER_CACHE_TTL = int(getattr(settings, 'ANSWER_CACHE_TTL', 3600))
+ANSWER_CACHE_SIMILARITY = float(getattr(settings, 'ANSWER_CACHE_SIMILARITY', 0.95))
+ANSWER_CACHE_SEMANTIC_ENTRIES = int(getattr(settings, 'ANSWER_CACHE_SEMANTIC_ENTRIES', 100))
+
+RETRIEVAL_CACHE_ENABLED = getattr(settings, 'RETRIEVAL_CACHE_ENABLED', True)
+RETRIEVAL_CACHE_TTL = int(getattr(settings, 'RETRIEVAL_CACHE_TTL', 600))
+RETRIEVAL_CACHE_MAX_ENTRIES = int(getattr(settings, 'RETRIEVAL_CACHE_MAX_ENTRIES', 2048))
+QUERY_EMBEDDING_CACHE_TTL = int(getattr(settings, 'QUERY_EMBEDDING_CACHE_TTL', 3600))
+QUERY_EMBEDDING_CACHE_MAX_ENTRIES = int(getattr(settings, 'QUERY_EMBEDDING_CACHE_MAX_ENTRIES', 4096))
+# Also read/write the shared Django cache (Redis) so all web workers share hits
+QUERY_CACHE_SHARED = getattr(settings, 'QUERY_CACHE_SHARED', False)
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r'[\s?!.]+$', '', " ".join(query.lower().split()))
+
+
+def _digest(*parts: Any) -> str:
+    return hashlib.sha256("|".join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+
+class AnswerCache:
+    """Two-tier (exact + semantic) answer cache for one user/prompt/index version."""
+
+    def __init__(self, user_id: int, custom_prompt: Optional[str], index_version: str, embeddings=None):
+        """
+        Args:
+            user_id: Owner of the knowledge base
+            custom_prompt: Active system prompt text (None for the default)
+            index_version: The user's knowledge base version
+            embeddings: Embeddings used for the semantic tier (None disables it)
+        """
+        self.scope = _digest(user_id, custom_prompt or '', index_version)[:32]
+        self.embeddings = embeddings
+
+    def _exact_key(self, query: str) -> str:
+        return f"knowbot:answer:{self.scope}:{_digest(normalize_query(query))}"
+
+    def _semantic_slot_keys(self) -> List[str]:
+        return [f"knowbot:answer-semantic:{self.scope}:{slot}"
+                for slot in range(ANSWER_CACHE_SEMANTIC_ENTRIES)]
+
+    @property
+    def _semantic_counter_key(self) -> str:
+        return f"knowbot:answer-semantic:{self.scope}:next"
+
+    def embed(self, query: str) -> Optional[List[float]]:
+        """Query embedding for the semantic tier (None if unavailable)."""
+        if self.embeddings is None:
+            return None
+        try:
+            return self.embeddings.embed_query(query)
+        except Exception as e:
+            print(f"Answer cache: query embedding failed: {e}")
+            return None
+
+    def get_exact(self, query: str) -> Optional[Dict[str, Any]]:
+        """Cached result ({"response", "citations"}) for the same normalized question."""
+        result = cache.get(self._exact_key(query))
+        if result is not None:
+            print("Answer cache: exact hit")
+        return result
+
+    def get_similar(self, query_embedding: Optional[List[float]]) -> Optional[Dict[str, Any]]:
+        """Cached result for the most similar earlier question above the threshold."""
+        if query_embedding is None:
+            return None
+        q = np.asarray(query_embedding, dtype=np.float32)
+        # One round trip for every slot; entries from another embedding size are skipped
+        entries = [
+            entry for entry in cache.get_many(self._semantic_slot_keys()).values()
+            if len(entry["embedding"]) == q.nbytes
+        ]
+        if not entries:
+            return None
+
+        matrix = np.frombuffer(
+            b"".join(entry["embedding"] for entry in entries), dtype=np.float32
+        ).reshape(len(entries), len(q))
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(q)
+        similarities = matrix @ q / np.where(norms == 0, 1.0, norms)
+        best = int(np.argmax(similarities))
+        if similarities[best] < ANSWER_CACHE_SIMILARITY:
+            return None
+        # The answer itself lives in the exact tier (None if it has expired)
+        result = cache.get(entries[best]["key"])
+        if result is not None:
+            print(f"Answer cache: semantic hit (similarity {similarities[best]:.3f})")
+        return result
+
+    def put(self, query: str, result: Dict[str, Any], query_embedding: Optional[List[float]] = None) -> None:
+        """Store a result in the exact tier, and in the semantic tier if embedded."""
+        exact_key = self._exact_key(query)
+        cache.set(exact_key, result, ANSWER_CACHE_TTL)
+        if query_embedding is None:
+            return
+
+        # incr is atomic (INCR in Redis), so every writer claims its own slot
+        counter_key = self._semantic_counter_key
+        cache.add(counter_key, 0, ANSWER_CACHE_TTL)
+        try:
+            slot = cache.incr(counter_key) % ANSWER_CACHE_SEMANTIC_ENTRIES
+        except ValueError:  # Counter expired between add and incr
+            slot = 0
+        cache.set(self._semantic_slot_keys()[slot], {
+            "embedding": np.asarray(query_embedding, dtype=np.float32).tobytes(),
+            "key": exact_key,
+        }, ANSWER_CACHE_TTL)
+
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache with a per-entry TTL.
+
+    With shared=True, misses fall through to the Django cache (Redis in the
+    docker setup) and writes go to both, so other processes' hits are reused.
+    """
+
+    def __init__(self, name: str, max_entries: int, ttl: int, shared: bool = False):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _shared_key(self, key: str) -> str:
+        return f"knowbot:{self.name}:{key}"
+
+    def get(self, key: str) -> Any:
+        """Cached value or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        value = None
+        if self.shared:
+            try:
+                value = cache.get(self._shared_key(key))
+            except Exception as e:
+                print(f"{self.name} cache: shared read failed: {e}")
+        if value is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        self._set_local(key, value)
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a value locally (and in the shared cache if enabled)."""
+        self._set_local(key, value)
+        if self.shared:
+            try:
+                cache.set(self._shared_key(key), value, self.ttl)
+            except Exception as e:
+                print(f"{self.name} cache: shared write failed: {e}")
+
+    def _set_local(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def retrieval_cache_key(user_id: int, query: str, k: int, index_version: str) -> str:
+    """Key for a ranked list of chunk ids: (user, normalized query, k, index version)."""
+    return _digest(user_id, normalize_query(query), k, index_version)
+
+
+# Process-wide caches (optionally shared through the Django cache)
+QUERY_EMBEDDING_CACHE = TTLCache(
+    'query-embedding', QUERY_EMBEDDING_CACHE_MAX_ENTRIES, QUERY_EMBEDDING_CACHE_TTL,
+    shared=QUERY_CACHE_SHARED
+)
+RETRIEVAL_CACHE = TTLCache(
+    'retrieval', RETRIEVAL_CACHE_MAX_ENTRIES, RETRIEVAL_CACHE_TTL,
+    shared=QUERY_CACHE_SHARED
+)
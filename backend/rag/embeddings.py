@@ -0,0 +1,339 @@
+"""
+Embedding Helpers for KnowBot 2.0
+
+Persistent, content-addressed cache in front of the Ollama embedding model, so
+re-uploads, reindexes and shared boilerplate pages don't pay for embedding the
+same text twice, plus an LRU+TTL cache for query embeddings and a
+micro-batcher that coalesces concurrent query embeddings into one call.
+"""
+
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+from django.conf import settings
+from langchain_core.embeddings import Embeddings
+
+from rag.storage import SQLiteCache
+
+
+EMBEDDING_CACHE_PATH = str(getattr(
+    settings, 'EMBEDDING_CACHE_PATH', './embedding_cache/embeddings.sqlite3'
+))
+EMBEDDING_CACHE_MAX_ENTRIES = int(getattr(settings, 'EMBEDDING_CACHE_MAX_ENTRIES', 500_000))
+QUERY_BATCH_WINDOW_MS = float(getattr(settings, 'QUERY_EMBEDDING_BATCH_WINDOW_MS', 5))
+QUERY_BATCH_MAX_SIZE = int(getattr(settings, 'QUERY_EMBEDDING_BATCH_MAX_SIZE', 32))
+# Longest a caller waits for its batch before giving up (seconds)
+QUERY_BATCH_TIMEOUT = float(getattr(settings, 'QUERY_EMBEDDING_BATCH_TIMEOUT', 60))
+
+
+def text_hash(text: str) -> str:
+    """SHA-256 of a chunk's text, the cache key within one embedding model."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache(SQLiteCache):
+    """
+    SQLite-backed (model, sha256(text)) -> vector store with LRU eviction.
+
+    The database lives on the shared volume, so the Celery worker and web
+    processes reuse each other's embeddings.
+    """
+
+    table = 'embeddings'
+    label = 'Embedding cache'
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        super().__init__(path, max_entries)
+
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL, PRIMARY KEY (model, hash))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """Look up vectors by text hash; touches hits for LRU."""
+        found: Dict[str, List[float]] = {}
+        if not hashes:
+            return found
+
+        conn = self._connect()
+        unique = list(dict.fromkeys(hashes))
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(unique), 500):
+            batch = unique[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                [model, *batch]
+            ).fetchall()
+            for h, blob in rows:
+                found[h] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+        if found:
+            now = time.time()
+            with conn:
+                conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?",
+                    [(now, model, h) for h in found]
+                )
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]) -> None:
+        """Store vectors by text hash, evicting old entries if over budget."""
+        if not vectors:
+            return
+
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(model, h, np.asarray(v, dtype=np.float32).tobytes(), now) for h, v in vectors.items()]
+            )
+        self._evict(conn)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that consults caches before the model.
+
+    Document (chunk) embeddings go through the persistent EmbeddingCache;
+    query embeddings through an in-memory LRU+TTL cache. Either may be None.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str,
+                 cache: Optional[EmbeddingCache] = None, query_cache=None):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.cache = cache
+        self.query_cache = query_cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.cache is None:
+            return self.underlying.embed_documents(texts)
+
+        hashes = [text_hash(text) for text in texts]
+        try:
+            vectors = self.cache.get_many(self.model_name, hashes)
+        except sqlite3.Error as e:
+            print(f"Embedding cache read failed: {e}")
+            vectors = {}
+
+        # Embed each distinct missing text once
+        missing: Dict[str, str] = {}
+        for h, text in zip(hashes, texts):
+            if h not in vectors and h not in missing:
+                missing[h] = text
+
+        if missing:
+            new_vectors = self.underlying.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), new_vectors))
+            vectors.update(fresh)
+            try:
+                self.cache.put_many(self.model_name, fresh)
+            except sqlite3.Error as e:
+                print(f"Embedding cache write failed: {e}")
+
+        print(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} embedded")
+        return [vectors[h] for h in hashes]
+
+    def _query_key(self, text: str) -> str:
+        return f"{self.model_name}:{text_hash(text)}"
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.query_cache is None:
+            return self.underlying.embed_query(text)
+        key = self._query_key(text)
+        vector = self.query_cache.get(key)
+        if vector is None:
+            vector = self.underlying.embed_query(text)
+            self.query_cache.set(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        if self.query_cache is None:
+            return await self.underlying.aembed_query(text)
+        key = self._query_key(text)
+        vector = self.query_cache.get(key)
+        if vector is None:
+            vector = await self.underlying.aembed_query(text)
+            self.query_cache.set(key, vector)
+        return vector
+
+
+_EMBEDDING_CACHE: Optional[EmbeddingCache] = None
+_EMBEDDING_CACHE_LOCK = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Process-wide EmbeddingCache singleton."""
+    global _EMBEDDING_CACHE
+    with _EMBEDDING_CACHE_LOCK:
+        if _EMBEDDING_CACHE is None:
+            _EMBEDDING_CACHE = EmbeddingCache()
+        return _EMBEDDING_CACHE
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces single-text embedding requests from concurrent threads.
+
+    Callers block on embed(); a background thread takes the first queued
+    request, keeps collecting for up to window_ms (or max_batch requests) and
+    sends all distinct texts to the model as one embed_documents call.
+    """
+
+    def __init__(self, embeddings: Embeddings, window_ms: float = QUERY_BATCH_WINDOW_MS,
+                 max_batch: int = QUERY_BATCH_MAX_SIZE, timeout: float = QUERY_BATCH_TIMEOUT):
+        self.embeddings = embeddings
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_pid = None
+        self._stats = {
+            "batches": 0,
+            "requests": 0,
+            "max_batch_size": 0,
+            "total_queue_delay": 0.0,
+            "max_queue_delay": 0.0,
+            "failed_batches": 0,
+        }
+
+    def _worker_running(self) -> bool:
+        # Threads don't survive fork (gunicorn/Celery prefork), so track the pid
+        return (self._worker_pid == os.getpid()
+                and self._worker is not None and self._worker.is_alive())
+
+    def _ensure_worker(self) -> None:
+        if self._worker_running():
+            return
+        with self._lock:
+            if self._worker_running():
+                return
+            if self._worker_pid != os.getpid():
+                # The parent's queue may hold requests whose callers aren't in this process
+                self._queue = queue.Queue()
+            self._worker = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+            self._worker.start()
+            self._worker_pid = os.getpid()
+
+    def embed(self, text: str) -> List[float]:
+        """Embed one text as part of the next batch."""
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((text, future, time.monotonic()))
+        return future.result(timeout=self.timeout)
+
+    def _run(self) -> None:
+        pending = self._queue
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch: List[tuple]) -> None:
+        """Embed one batch; never raises, so the worker thread survives bad batches."""
+        started = time.monotonic()
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        failed = False
+        try:
+            embedded = self.embeddings.embed_documents(texts)
+            if len(embedded) != len(texts):
+                raise ValueError(f"Embedding model returned {len(embedded)} vectors for {len(texts)} texts")
+            results = dict(zip(texts, embedded))
+        except Exception as e:
+            failed = True
+            results = {text: e for text in texts}
+            if len(texts) > 1:
+                # Retry each text on its own so one bad input only fails its own callers
+                print(f"Query embedding batch of {len(texts)} failed, retrying individually: {e}")
+                for text in texts:
+                    try:
+                        results[text] = self.embeddings.embed_documents([text])[0]
+                    except Exception as text_error:
+                        results[text] = text_error
+
+        for text, future, _ in batch:
+            if future.done():
+                continue
+            result = results[text]
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+        delays = [started - queued_at for _, _, queued_at in batch]
+        with self._lock:
+            stats = self._stats
+            stats["batches"] += 1
+            stats["failed_batches"] += failed
+            stats["requests"] += len(batch)
+            stats["max_batch_size"] = max(stats["max_batch_size"], len(batch))
+            stats["total_queue_delay"] += sum(delays)
+            stats["max_queue_delay"] = max(stats["max_queue_delay"], max(delays))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Batch size and queueing delay metrics since process start."""
+        with self._lock:
+            stats = dict(self._stats)
+        batches, requests = stats["batches"], stats["requests"]
+        return {
+            "batches": batches,
+            "requests": requests,
+            "mean_batch_size": round(requests / batches, 2) if batches else 0.0,
+            "max_batch_size": stats["max_batch_size"],
+            "mean_queue_delay_ms": round(1000 * stats["total_queue_delay"] / requests, 2) if requests else 0.0,
+            "max_queue_delay_ms": round(1000 * stats["max_queue_delay"], 2),
+            "failed_batches": stats["failed_batches"],
+        }
+
+
+class MicroBatchedEmbeddings(Embeddings):
+    """Embeddings whose embed_query goes through an EmbeddingBatcher."""
+
+    def __init__(self, underlying: Embeddings, batcher: EmbeddingBatcher):
+        self.underlying = underlying
+        self.batcher = batcher
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.batcher.embed(text)
+
+
+_QUERY_BATCHERS: Dict[str, EmbeddingBatcher] = {}
+
+
+def get_query_batcher(model_name: str, embeddings: Embeddings) -> EmbeddingBatcher:
+    """Process-wide batcher per embedding model, shared by all requests."""
+    with _EMBEDDING_CACHE_LOCK:
+        if model_name not in _QUERY_BATCHERS:
+            _QUERY_BATCHERS[model_name] = EmbeddingBatcher(embeddings)
+        return _QUERY_BATCHERS[model_name]
+
+
+def get_query_batcher_stats() -> Dict[str, Dict[str, Any]]:
+    """Metrics of every query batcher in this process, by model."""
+    return {model: batcher.get_stats() for model, batcher in _QUERY_BATCHERS.items()}
@@ -1,31 +1,65 @@
 """
 Hybrid Search Module for KnowBot 2.0
 
-Implements BM25 + Semantic (Vector) search fusion using Reciprocal Rank Fusion (RRF).
+Implements BM25 + Semantic (Vector) search fusion using Reciprocal Rank Fusion (RRF)
+or normalized score fusion (CombSUM/CombMNZ).
 This improves retrieval accuracy by combining exact keyword matching with semantic understanding.
 """
 
-from typing import List, Dict, Any, Optional, Callable
+import asyncio
+import heapq
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Optional, Callable, Set
 
-from collections import defaultdict
+from collections import Counter, defaultdict
 
+import numpy as np
 from langchain_core.documents import Document
 from langchain_core.retrievers import BaseRetriever
-from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+)
+from django.conf import settings
 
+from rag.bm25_store import BM25SegmentStore
+from rag.keyword_backends import PostgresKeywordIndex, active_keyword_backend
 
-# Try to import rank_bm25
-try:
-    from rank_bm25 import BM25Okapi
-    BM25_AVAILABLE = True
-except ImportError:
-    BM25_AVAILABLE = False
-    print("Warning: rank_bm25 not installed. Hybrid search disabled.")
+
+# BM25 parameters (same defaults as rank_bm25's BM25Okapi)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Memory budget for the per-process cache of users' BM25 indexes
+BM25_INDEX_MEMORY_BUDGET = int(getattr(settings, 'BM25_INDEX_MEMORY_MB', 512)) * 2 ** 20
+# Rough CPython cost of one posting (dict entry) and one chunk's Document/bookkeeping
+BM25_POSTING_BYTES = 80
+BM25_DOCUMENT_BYTES = 600
+
+# Fusion defaults: candidates per leg = k * FETCH_K_MULTIPLIER unless fetch_k is given
+FUSION_METHOD = getattr(settings, 'HYBRID_FUSION_METHOD', 'rrf')
+FETCH_K_MULTIPLIER = int(getattr(settings, 'HYBRID_FETCH_K_MULTIPLIER', 2))
+
+# Per-leg timeouts (seconds) for concurrent hybrid retrieval. The keyword leg
+# runs on the calling thread in sync retrieval, so BM25_TIMEOUT only bounds it
+# in async retrieval, where it runs on the pool.
+SEMANTIC_TIMEOUT = float(getattr(settings, 'HYBRID_SEMANTIC_TIMEOUT', 30.0))
+BM25_TIMEOUT = float(getattr(settings, 'HYBRID_BM25_TIMEOUT', 5.0))
+
+# Shared pool running the leg of each query that doesn't run on the caller's thread
+_RETRIEVAL_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(getattr(settings, 'HYBRID_RETRIEVAL_WORKERS', 16)),
+    thread_name_prefix='hybrid-retrieval'
+)
 
 
 def is_bm25_available() -> bool:
-    """Check if BM25 is available."""
-    return BM25_AVAILABLE
+    """Check if BM25 is available (the engine is native, so always True)."""
+    return True
 
 
 def tokenize(text: str) -> List[str]:
@@ -33,7 +67,6 @@ def tokenize(text: str) -> List[str]:
     Simple tokenizer for BM25.
     Lowercases and splits on whitespace/punctuation.
     """
-    import re
     # Remove punctuation and lowercase
     text = re.sub(r'[^\w\s]', ' ', text.lower())
     # Split on whitespace and filter empty
@@ -43,23 +76,72 @@ def tokenize(text: str) -> List[str]:
 
 class BM25Index:
     """
-    BM25 keyword index for document chunks.
+    Incremental BM25 keyword index for document chunks.
+    
+    Keeps an inverted index (term -> {doc_idx: term frequency}) plus document
+    frequency and length statistics that are updated in place, so adding a
+    chunk costs O(its tokens) instead of rebuilding the whole index, and a
+    query only touches the postings of its own terms.
+    
+    IDF uses the non-negative Lucene variant log(1 + (N - df + 0.5) / (df + 0.5)),
+    which (unlike BM25Okapi's epsilon floor) needs no corpus-wide pass on update.
+    
+    Deletes are tombstones keyed by the chunk's file_path: deleted chunks are
+    skipped by searches but keep counting in the collection statistics until
+    compact() rebuilds the postings from the live chunks. remove_ranges()
+    instead takes chunks out of the postings and statistics entirely, leaving
+    empty slots so later document indices don't shift.
     """
     
-    def __init__(self, documents: List[Document] = None):
+    def __init__(self, documents: List[Document] = None, k1: float = BM25_K1, b: float = BM25_B):
         """
         Initialize the BM25 index.
         
         Args:
             documents: Optional list of LangChain Documents to index
+            k1: Term frequency saturation parameter
+            b: Length normalization parameter
         """
+        self.k1 = k1
+        self.b = b
         self.documents: List[Document] = []
-        self.tokenized_corpus: List[List[str]] = []
-        self.bm25: Optional[BM25Okapi] = None
+        self.doc_lengths: List[int] = []
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.total_length = 0
+        self.file_path_docs: Dict[str, List[int]] = defaultdict(list)
+        self.deleted: Set[int] = set()
+        self.text_bytes = 0
+        self.posting_count = 0
+        self.removed = 0  # Empty slots left by remove_ranges()
         
         if documents:
             self.add_documents(documents)
     
+    def __len__(self) -> int:
+        return len(self.documents) - self.removed
+    
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the index (chunk text, postings, documents)."""
+        return (
+            self.text_bytes
+            + self.posting_count * BM25_POSTING_BYTES
+            + len(self) * BM25_DOCUMENT_BYTES
+        )
+    
+    @property
+    def avgdl(self) -> float:
+        """Average document length in tokens."""
+        n = len(self)
+        return self.total_length / n if n else 0.0
+    
+    def idf(self, term: str) -> float:
+        """Inverse document frequency of a term (0.0 if unseen)."""
+        df = len(self.postings.get(term, ()))
+        if not df:
+            return 0.0
+        n = len(self)
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+    
     def add_documents(self, documents: List[Document]) -> None:
         """
         Add documents to the BM25 index.
@@ -67,19 +149,190 @@ class BM25Index:
         Args:
             documents: List of LangChain Documents
         """
-        if not BM25_AVAILABLE:
-            print("Warning: BM25 not available, skipping index update")
+        for doc in documents:
+            self.add_tokens(doc, tokenize(doc.page_content))
+        
+        if documents:
+            print(f"BM25 index updated: {len(self)} documents")
+    
+    def add_tokens(self, doc: Document, tokens: List[str]) -> int:
+        """
+        Add one pre-tokenized document to the index.
+        
+        Args:
+            doc: LangChain Document to return from searches
+            tokens: Tokens of doc.page_content
+        
+        Returns:
+            Internal index of the added document
+        """
+        term_freqs: Dict[str, int] = defaultdict(int)
+        for token in tokens:
+            term_freqs[token] += 1
+        return self.add_term_freqs(doc, term_freqs, len(tokens))
+    
+    def add_term_freqs(self, doc: Document, term_freqs: Dict[str, int], length: int) -> int:
+        """
+        Add one document given its term frequencies (e.g. read back from disk).
+        
+        Args:
+            doc: LangChain Document to return from searches
+            term_freqs: Mapping of term to its count in the document
+            length: Number of tokens in the document
+        
+        Returns:
+            Internal index of the added document
+        """
+        doc_idx = len(self.documents)
+        self.documents.append(doc)
+        self.doc_lengths.append(length)
+        self.total_length += length
+        self.text_bytes += len(doc.page_content)
+        self.posting_count += len(term_freqs)
+        
+        for term, tf in term_freqs.items():
+            self.postings.setdefault(term, {})[doc_idx] = tf
+        
+        file_path = doc.metadata.get('file_path')
+        if file_path:
+            self.file_path_docs[file_path].append(doc_idx)
+        
+        return doc_idx
+    
+    def delete_documents(self, file_path: str) -> int:
+        """
+        Tombstone all chunks of a document.
+        
+        Args:
+            file_path: The document's file_path metadata value
+        
+        Returns:
+            Number of chunks newly tombstoned
+        """
+        doc_idxs = [i for i in self.file_path_docs.pop(file_path, []) if i not in self.deleted]
+        self.deleted.update(doc_idxs)
+        return len(doc_idxs)
+    
+    def remove_ranges(self, ranges: List[tuple]) -> int:
+        """
+        Remove documents from the postings and collection statistics.
+        
+        Unlike tombstones, removed documents no longer count towards N, df or
+        the average length; their slots stay (empty) so indices don't shift.
+        
+        Args:
+            ranges: (start, end) internal index ranges, end exclusive
+        
+        Returns:
+            Number of documents removed
+        """
+        doomed = set()
+        for start, end in ranges:
+            doomed.update(i for i in range(start, end) if self.documents[i] is not None)
+        if not doomed:
+            return 0
+        
+        for term in list(self.postings):
+            postings = self.postings[term]
+            for doc_idx in [i for i in postings if i in doomed]:
+                del postings[doc_idx]
+                self.posting_count -= 1
+            if not postings:
+                del self.postings[term]
+        
+        for doc_idx in doomed:
+            self.total_length -= self.doc_lengths[doc_idx]
+            self.text_bytes -= len(self.documents[doc_idx].page_content)
+            self.doc_lengths[doc_idx] = 0
+            self.documents[doc_idx] = None
+        self.removed += len(doomed)
+        self.deleted -= doomed
+        for file_path in list(self.file_path_docs):
+            kept = [i for i in self.file_path_docs[file_path] if i not in doomed]
+            if kept:
+                self.file_path_docs[file_path] = kept
+            else:
+                del self.file_path_docs[file_path]
+        return len(doomed)
+    
+    def compact(self) -> None:
+        """Rebuild the index from live chunks, dropping tombstoned and removed ones."""
+        if not self.deleted and not self.removed:
             return
+        live = [
+            doc for i, doc in enumerate(self.documents)
+            if doc is not None and i not in self.deleted
+        ]
+        BM25Index.clear(self)
+        for doc in live:
+            self.add_tokens(doc, tokenize(doc.page_content))
+    
+    def top_k(self, query_tokens: List[str], k: int) -> List[tuple]:
+        """
+        Exact top-k BM25 scoring with MaxScore-style early termination.
         
-        for doc in documents:
-            self.documents.append(doc)
-            tokens = tokenize(doc.page_content)
-            self.tokenized_corpus.append(tokens)
+        Query terms are processed term-at-a-time in decreasing order of their
+        maximum possible contribution (qtf * idf * (k1 + 1)). Once the k-th best
+        score so far exceeds the summed bounds of the remaining terms, no unseen
+        document can enter the top k, so later (low-idf, long) postings lists
+        only update existing candidates, and candidates that can no longer
+        reach the threshold are dropped. The final selection uses a heap rather
+        than sorting every candidate.
+        
+        Args:
+            query_tokens: Tokenized query
+            k: Number of results to return
+        
+        Returns:
+            List of (internal document index, score) tuples, best first
+        """
+        if not self.documents or k <= 0:
+            return []
         
-        # Rebuild BM25 index
-        if self.tokenized_corpus:
-            self.bm25 = BM25Okapi(self.tokenized_corpus)
-            print(f"BM25 index updated: {len(self.documents)} documents")
+        k1, b = self.k1, self.b
+        avgdl = self.avgdl or 1.0
+        doc_lengths = self.doc_lengths
+        deleted = self.deleted
+        
+        terms = []
+        for term, qtf in Counter(query_tokens).items():
+            postings = self.postings.get(term)
+            if postings:
+                weight = qtf * self.idf(term)
+                terms.append((weight * (k1 + 1), weight, postings))
+        terms.sort(key=lambda t: t[0], reverse=True)
+        
+        remaining = sum(t[0] for t in terms)
+        scores: Dict[int, float] = defaultdict(float)
+        accept_new = True
+        
+        for upper_bound, weight, postings in terms:
+            remaining -= upper_bound
+            
+            if accept_new:
+                for doc_idx, tf in postings.items():
+                    if doc_idx in deleted:
+                        continue
+                    norm = k1 * (1 - b + b * doc_lengths[doc_idx] / avgdl)
+                    scores[doc_idx] += weight * tf * (k1 + 1) / (tf + norm)
+            else:
+                # Only existing candidates can still make the top k
+                for doc_idx in scores:
+                    tf = postings.get(doc_idx)
+                    if tf:
+                        norm = k1 * (1 - b + b * doc_lengths[doc_idx] / avgdl)
+                        scores[doc_idx] += weight * tf * (k1 + 1) / (tf + norm)
+            
+            if len(scores) >= k and remaining > 0:
+                threshold = heapq.nlargest(k, scores.values())[-1]
+                if remaining <= threshold:
+                    accept_new = False
+                    scores = defaultdict(float, {
+                        doc_idx: score for doc_idx, score in scores.items()
+                        if score + remaining >= threshold
+                    })
+        
+        return heapq.nlargest(k, scores.items(), key=lambda x: x[1])
     
     def search(self, query: str, k: int = 10) -> List[tuple]:
         """
@@ -92,76 +345,312 @@ class BM25Index:
         Returns:
             List of (document, score) tuples
         """
-        if not BM25_AVAILABLE or self.bm25 is None:
-            return []
+        ranked = self.top_k(tokenize(query), k)
+        return [(self.documents[i], score) for i, score in ranked]
+    
+    def clear(self) -> None:
+        """Clear the index."""
+        self.documents = []
+        self.doc_lengths = []
+        self.postings = {}
+        self.total_length = 0
+        self.file_path_docs = defaultdict(list)
+        self.deleted = set()
+        self.text_bytes = 0
+        self.posting_count = 0
+        self.removed = 0
+
+
+class PersistentBM25Index(BM25Index):
+    """
+    BM25 index backed by a user's on-disk segment store.
+    
+    Segments written by any process (typically the Celery indexer) are picked
+    up lazily: each search checks the manifest and loads only segments it has
+    not seen yet, and applies the manifest's tombstones. Segments merged away
+    on disk are removed from the in-memory postings and statistics (so a
+    long-lived reader ranks exactly like a fresh one) while their merged
+    replacement is loaded; once more than RELOAD_DEAD_RATIO of the slots are
+    empty (e.g. after a full compaction or reset), the index is rebuilt from
+    disk instead.
+    """
+    
+    RELOAD_DEAD_RATIO = 0.5
+    
+    def __init__(self, store: BM25SegmentStore, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+        self.loaded_segments: List[str] = []
+        self.segment_ranges: Dict[str, tuple] = {}
+        self._manifest_stamp = None
+        self._lock = threading.RLock()
+    
+    def refresh(self) -> None:
+        """Load any segments published since the last refresh."""
+        stamp = self.store.manifest_stamp()
+        if stamp == self._manifest_stamp:
+            return
         
-        query_tokens = tokenize(query)
-        scores = self.bm25.get_scores(query_tokens)
+        with self._lock:
+            if stamp == self._manifest_stamp:
+                return
+            try:
+                self._load_manifest(stamp)
+            except FileNotFoundError:
+                # A segment was merged or compacted away after we read the
+                # manifest; segments loaded so far are intact, so read it again
+                if self.store.manifest_stamp() == stamp:
+                    raise
+                self._manifest_stamp = None
+                return self.refresh()
+    
+    def _load_manifest(self, stamp: Optional[tuple]) -> None:
+        """Apply the current manifest to the in-memory index (lock held)."""
+        manifest = self.store.read_manifest()
+        names = [segment["name"] for segment in manifest["segments"]]
+        
+        current = set(names)
+        removed = [name for name in self.loaded_segments if name not in current]
+        if removed:
+            ranges = [self.segment_ranges[name] for name in removed]
+            empty = self.removed + sum(end - start for start, end in ranges)
+            if empty > self.RELOAD_DEAD_RATIO * len(self.documents):
+                BM25Index.clear(self)
+                self.loaded_segments = []
+                self.segment_ranges = {}
+            else:
+                self.remove_ranges(ranges)
+                for name in removed:
+                    self.loaded_segments.remove(name)
+                    del self.segment_ranges[name]
+        
+        loaded = set(self.loaded_segments)
+        for name in names:
+            if name in loaded:
+                continue
+            start = len(self.documents)
+            for record in self.store.iter_segment(name):
+                doc = Document(page_content=record["content"], metadata=record["metadata"])
+                self.add_term_freqs(doc, record["tf"], record["len"])
+            self.loaded_segments.append(name)
+            self.segment_ranges[name] = (start, len(self.documents))
         
-        # Get top k documents with their scores
-        doc_scores = [(self.documents[i], scores[i]) for i in range(len(scores))]
-        doc_scores.sort(key=lambda x: x[1], reverse=True)
+        # Tombstones are scoped to the segments they were recorded on
+        for segment in manifest["segments"]:
+            start, end = self.segment_ranges[segment["name"]]
+            for file_path in segment["deleted"]:
+                self.deleted.update(
+                    i for i in self.file_path_docs.get(file_path, ()) if start <= i < end
+                )
         
-        return doc_scores[:k]
+        self._manifest_stamp = stamp
+    
+    def add_documents(self, documents: List[Document]) -> None:
+        """Persist documents as a new segment, then load it into memory."""
+        self.store.append(documents)
+        self.refresh()
+    
+    def search(self, query: str, k: int = 10) -> List[tuple]:
+        """Search the index after picking up newly published segments."""
+        self.refresh()
+        with self._lock:
+            return super().search(query, k)
     
     def clear(self) -> None:
-        """Clear the index."""
-        self.documents = []
-        self.tokenized_corpus = []
-        self.bm25 = None
+        """Drop the in-memory copy; it is reloaded from disk on next use."""
+        with self._lock:
+            super().clear()
+            self.loaded_segments = []
+            self.segment_ranges = {}
+            self._manifest_stamp = None
+    
+    def delete_documents(self, file_path: str) -> int:
+        """Tombstone a document on disk; the change is applied on next refresh."""
+        return self.store.delete_file(file_path)
+    
+    def compact(self) -> None:
+        """Compact the on-disk segments; readers reload on next refresh."""
+        self.store.compact()
+
+
+FUSION_METHODS = ('rrf', 'combsum', 'combmnz')
+
+
+def chunk_key(doc: Document) -> str:
+    """
+    Stable identity of a chunk for fusion and caching.
+    
+    Uses the chunk_id assigned at indexing time (also the Chroma vector id);
+    chunks indexed before chunk ids existed fall back to a content hash.
+    """
+    return doc.metadata.get('chunk_id') or doc.id or str(hash(doc.page_content))
+
+
+def fuse_results(
+    ranked_lists: List[List[tuple]],
+    weights: List[float],
+    k: int,
+    method: str = 'rrf',
+    rrf_k: int = 60
+) -> List[Document]:
+    """
+    Fuse several ranked (document, score) lists into one top-k list.
+    
+    Builds a (unique chunks x lists) matrix of ranks and scores and fuses it
+    with NumPy:
+    - rrf:     sum(weight / (rrf_k + rank))
+    - combsum: sum(weight * min-max normalized score)
+    - combmnz: combsum * number of lists the chunk appears in
+    
+    Args:
+        ranked_lists: One list of (document, score) tuples per retriever, best first
+        weights: Weight of each list
+        k: Number of documents to return
+        method: One of FUSION_METHODS
+        rrf_k: RRF rank offset
+    
+    Returns:
+        Top k documents, best first
+    """
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method: {method}")
+    
+    rows: Dict[str, int] = {}
+    docs: List[Document] = []
+    for results in ranked_lists:
+        for doc, _ in results:
+            key = chunk_key(doc)
+            if key not in rows:
+                rows[key] = len(docs)
+                docs.append(doc)
+    if not docs:
+        return []
+    
+    ranks = np.full((len(docs), len(ranked_lists)), np.inf)
+    scores = np.zeros((len(docs), len(ranked_lists)))
+    for col, results in enumerate(ranked_lists):
+        if not results:
+            continue
+        idx = np.fromiter((rows[chunk_key(doc)] for doc, _ in results), dtype=np.intp, count=len(results))
+        ranks[idx, col] = np.arange(1, len(results) + 1)
+        leg_scores = np.array([score for _, score in results], dtype=float)
+        spread = leg_scores.max() - leg_scores.min()
+        scores[idx, col] = (leg_scores - leg_scores.min()) / spread if spread > 0 else 1.0
+    
+    w = np.asarray(weights, dtype=float)
+    if method == 'rrf':
+        fused = (w / (rrf_k + ranks)).sum(axis=1)
+    else:
+        fused = (scores * w).sum(axis=1)
+        if method == 'combmnz':
+            fused *= np.isfinite(ranks).sum(axis=1)
+    
+    if len(docs) > k:
+        top = np.argpartition(-fused, k - 1)[:k]
+        top = top[np.argsort(-fused[top], kind='stable')]
+    else:
+        top = np.argsort(-fused, kind='stable')
+    return [docs[i] for i in top]
 
 
 class HybridRetriever(BaseRetriever):
     """
     Hybrid retriever that fuses BM25 and semantic search results
-    using Reciprocal Rank Fusion (RRF).
+    using Reciprocal Rank Fusion (RRF) or normalized score fusion.
+    
+    The keyword leg is any object with search(query, k) returning (document,
+    score) tuples, i.e. a BM25Index or a PostgresKeywordIndex. Unless a fixed
+    bm25_index is given, it is resolved for user_id on every query, so the
+    retriever never pins an index the LRU cache has evicted.
     
     Inherits from BaseRetriever for LangChain Runnable compatibility.
     """
     
     # Pydantic fields for BaseRetriever
     vector_retriever: Any
-    bm25_index: Any
+    bm25_index: Any = None
+    user_id: Optional[int] = None
     semantic_weight: float = 0.6
     bm25_weight: float = 0.4
     rrf_k: int = 60
+    semantic_timeout: float = SEMANTIC_TIMEOUT
+    bm25_timeout: float = BM25_TIMEOUT
+    k: int = 5
+    fetch_k: Optional[int] = None
+    fusion: str = FUSION_METHOD
     
     class Config:
         arbitrary_types_allowed = True
     
-    def _reciprocal_rank_fusion(
+    @property
+    def candidate_depth(self) -> int:
+        """Number of candidates fetched from each leg before fusion."""
+        return max(self.fetch_k or self.k * FETCH_K_MULTIPLIER, self.k)
+    
+    def _keyword_search(self, query: str, fetch_k: int) -> List[tuple]:
+        """Keyword leg, resolving the user's index for this query."""
+        index = self.bm25_index if self.bm25_index is not None else get_keyword_index(self.user_id)
+        return index.search(query, fetch_k)
+    
+    def _semantic_search(self, query: str, fetch_k: int) -> List[tuple]:
+        """
+        Semantic leg returning (document, relevance score) tuples.
+        
+        Uses the retriever's vector store directly (keeping its filter) so
+        score fusion gets real similarity scores; plain retrievers fall back
+        to rank-derived scores.
+        """
+        store = getattr(self.vector_retriever, 'vectorstore', None)
+        if store is not None:
+            search_kwargs = dict(getattr(self.vector_retriever, 'search_kwargs', {}))
+            search_kwargs['k'] = fetch_k
+            return store.similarity_search_with_relevance_scores(query, **search_kwargs)
+        docs = self.vector_retriever.invoke(query)[:fetch_k]
+        return [(doc, 1.0 / rank) for rank, doc in enumerate(docs, start=1)]
+    
+    async def _asemantic_search(self, query: str, fetch_k: int) -> List[tuple]:
+        """Async variant of _semantic_search."""
+        store = getattr(self.vector_retriever, 'vectorstore', None)
+        if store is not None:
+            search_kwargs = dict(getattr(self.vector_retriever, 'search_kwargs', {}))
+            search_kwargs['k'] = fetch_k
+            return await store.asimilarity_search_with_relevance_scores(query, **search_kwargs)
+        docs = (await self.vector_retriever.ainvoke(query))[:fetch_k]
+        return [(doc, 1.0 / rank) for rank, doc in enumerate(docs, start=1)]
+    
+    def _fuse(
         self,
-        semantic_docs: List[Document],
+        semantic_results: List[tuple],
         bm25_results: List[tuple],
         k: int
     ) -> List[Document]:
-        """
-        Fuse results using Reciprocal Rank Fusion.
-        
-        RRF score = sum(weight / (rrf_k + rank))
-        """
-        # Calculate RRF scores
-        rrf_scores: Dict[str, float] = defaultdict(float)
-        doc_map: Dict[str, Document] = {}
-        
-        # Process semantic results
-        for rank, doc in enumerate(semantic_docs, start=1):
-            doc_id = hash(doc.page_content)
-            rrf_scores[doc_id] += self.semantic_weight / (self.rrf_k + rank)
-            doc_map[doc_id] = doc
-        
-        # Process BM25 results
-        for rank, (doc, score) in enumerate(bm25_results, start=1):
-            doc_id = hash(doc.page_content)
-            rrf_scores[doc_id] += self.bm25_weight / (self.rrf_k + rank)
-            if doc_id not in doc_map:
-                doc_map[doc_id] = doc
-        
-        # Sort by RRF score
-        sorted_ids = sorted(rrf_scores.keys(), key=lambda x: rrf_scores[x], reverse=True)
-        
-        # Return top k documents
-        return [doc_map[doc_id] for doc_id in sorted_ids[:k]]
+        """Combine the two legs, falling back to whichever one returned results."""
+        if not bm25_results:
+            return [doc for doc, _ in semantic_results[:k]]
+        if not semantic_results:
+            return [doc for doc, _ in bm25_results[:k]]
+        return fuse_results(
+            [semantic_results, bm25_results],
+            [self.semantic_weight, self.bm25_weight],
+            k,
+            method=self.fusion,
+            rrf_k=self.rrf_k
+        )
+    
+    @staticmethod
+    def _leg_result(name: str, outcome: Any, timeout: float, started: bool = True) -> Any:
+        """Turn a failed or timed-out leg into an empty result (logged)."""
+        if isinstance(outcome, (FutureTimeoutError, asyncio.TimeoutError)):
+            if not started:
+                print(f"Hybrid retrieval: {name} search timed out after {timeout}s "
+                      f"before it started (retrieval pool saturated)")
+            else:
+                print(f"Hybrid retrieval: {name} search timed out after {timeout}s")
+            return []
+        if isinstance(outcome, Exception):
+            print(f"Hybrid retrieval: {name} search failed: {outcome}")
+            return []
+        return outcome
     
     def _get_relevant_documents(
         self, 
@@ -171,82 +660,268 @@ class HybridRetriever(BaseRetriever):
     ) -> List[Document]:
         """
         Required method for BaseRetriever - retrieves documents using hybrid search.
+        
+        The semantic leg (query embedding + vector search) runs on the shared
+        thread pool, bounded by semantic_timeout, while the keyword leg runs
+        on the calling thread, so latency is roughly max(semantic, keyword)
+        rather than their sum and each query holds one pool thread, not two.
+        A leg that fails or times out is dropped; if the semantic leg fails
+        and the keyword leg has nothing either, the semantic error is raised.
         """
-        k = 5  # Default number of documents
-        fetch_k = k * 2
+        fetch_k = self.candidate_depth
         
-        # Semantic search
-        semantic_docs = self.vector_retriever.invoke(query)[:fetch_k]
+        semantic_future = _RETRIEVAL_EXECUTOR.submit(self._semantic_search, query, fetch_k)
+        # The timeout is measured from submission, not from when we start waiting
+        submitted = time.monotonic()
         
-        # BM25 search
-        bm25_results = self.bm25_index.search(query, k=fetch_k)
+        try:
+            bm25 = self._keyword_search(query, fetch_k)
+        except Exception as e:
+            bm25 = e
         
-        # If BM25 has no results, fall back to pure semantic
-        if not bm25_results:
-            return semantic_docs[:k]
+        semantic_started = True
+        try:
+            remaining = max(0.0, submitted + self.semantic_timeout - time.monotonic())
+            semantic = semantic_future.result(timeout=remaining)
+        except FutureTimeoutError as e:
+            semantic = e
+            # Still queued behind other queries: drop it rather than run it late
+            semantic_started = not semantic_future.cancel()
+        except Exception as e:
+            semantic = e
+        
+        return self._combine_legs(semantic, bm25, self.k, semantic_started=semantic_started)
+    
+    async def _aget_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: AsyncCallbackManagerForRetrieverRun = None
+    ) -> List[Document]:
+        """Async variant of _get_relevant_documents running both legs concurrently."""
+        fetch_k = self.candidate_depth
+        
+        bm25_started = threading.Event()
+        
+        def keyword_search():
+            bm25_started.set()
+            return self._keyword_search(query, fetch_k)
+        
+        loop = asyncio.get_running_loop()
+        semantic, bm25 = await asyncio.gather(
+            asyncio.wait_for(self._asemantic_search(query, fetch_k), self.semantic_timeout),
+            asyncio.wait_for(loop.run_in_executor(_RETRIEVAL_EXECUTOR, keyword_search), self.bm25_timeout),
+            return_exceptions=True
+        )
+        
+        return self._combine_legs(semantic, bm25, self.k, bm25_started=bm25_started.is_set())
+    
+    def _combine_legs(
+        self,
+        semantic: Any,
+        bm25: Any,
+        k: int,
+        semantic_started: bool = True,
+        bm25_started: bool = True
+    ) -> List[Document]:
+        """Apply per-leg failure handling, then fuse."""
+        semantic_results = self._leg_result("semantic", semantic, self.semantic_timeout, semantic_started)
+        bm25_results = self._leg_result("BM25", bm25, self.bm25_timeout, bm25_started)
+        
+        if not semantic_results and not bm25_results and isinstance(semantic, Exception):
+            raise semantic
         
-        # Fuse results
-        return self._reciprocal_rank_fusion(semantic_docs, bm25_results, k)
+        return self._fuse(semantic_results, bm25_results, k)
     
     def invoke(self, query: str, config: Any = None) -> List[Document]:
         """Invoke method for direct calls."""
         return self._get_relevant_documents(query)
 
 
-# Global BM25 index cache (per user)
-_BM25_INDEXES: Dict[int, BM25Index] = {}
+class BM25IndexCache:
+    """
+    Memory-budgeted LRU of users' loaded BM25 indexes.
+    
+    Long-lived web workers would otherwise keep an index for every user who
+    ever searched. On a miss the index is (re)loaded from the user's segment
+    store; once the estimated size of all resident indexes exceeds the budget,
+    the least recently used ones are dropped (the one just used always stays).
+    An evicted index is freed once in-flight searches holding it finish.
+    """
+    
+    def __init__(self, budget_bytes: int = BM25_INDEX_MEMORY_BUDGET):
+        self.budget_bytes = budget_bytes
+        self._indexes: "OrderedDict[int, PersistentBM25Index]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+    
+    def get(self, user_id: int = None) -> PersistentBM25Index:
+        """
+        The user's index, loaded and up to date with its segment store.
+        
+        Args:
+            user_id: User ID for index isolation
+        
+        Returns:
+            PersistentBM25Index instance
+        """
+        key = user_id or 0
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                self.hits += 1
+            else:
+                index = PersistentBM25Index(BM25SegmentStore(user_id))
+                self._indexes[key] = index
+                self.loads += 1
+        
+        # Load outside the cache lock; concurrent misses share the index's own lock
+        index.refresh()
+        self._evict()
+        return index
+    
+    def memory_bytes(self) -> int:
+        """Estimated size of all resident indexes."""
+        with self._lock:
+            return sum(index.memory_bytes() for index in self._indexes.values())
+    
+    def _evict(self) -> None:
+        with self._lock:
+            total = sum(index.memory_bytes() for index in self._indexes.values())
+            while total > self.budget_bytes and len(self._indexes) > 1:
+                key, index = self._indexes.popitem(last=False)
+                total -= index.memory_bytes()
+                self.evictions += 1
+                print(f"BM25 index cache evicted user {key} ({index.memory_bytes() / 2 ** 20:.1f} MiB)")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Residency and hit/load/eviction counters since process start."""
+        with self._lock:
+            return {
+                "indexes": len(self._indexes),
+                "memory_bytes": sum(index.memory_bytes() for index in self._indexes.values()),
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
 
 
-def get_bm25_index(user_id: int = None) -> BM25Index:
+# Per-process cache of loaded BM25 indexes (per user); the source of truth is on disk
+_BM25_INDEXES = BM25IndexCache()
+
+
+def get_bm25_index(user_id: int = None) -> PersistentBM25Index:
     """
-    Get or create BM25 index for a user.
+    Get or load the persisted BM25 index for a user.
     
     Args:
         user_id: User ID for index isolation
     
     Returns:
-        BM25Index instance
+        PersistentBM25Index instance (may be evicted from the cache later, so
+        resolve it again rather than holding on to it)
     """
-    key = user_id or 0
-    if key not in _BM25_INDEXES:
-        _BM25_INDEXES[key] = BM25Index()
-    return _BM25_INDEXES[key]
+    return _BM25_INDEXES.get(user_id)
+
+
+def get_bm25_index_stats() -> Dict[str, Any]:
+    """Metrics of this process's BM25 index cache."""
+    return _BM25_INDEXES.get_stats()
+
+
+def get_keyword_index(user_id: int = None):
+    """
+    Keyword leg of a user's hybrid search, per KEYWORD_BACKEND.
+    
+    Args:
+        user_id: User ID for index isolation
+    
+    Returns:
+        PostgresKeywordIndex, or the user's PersistentBM25Index
+    """
+    if active_keyword_backend() == 'postgres':
+        return PostgresKeywordIndex(user_id)
+    return get_bm25_index(user_id)
 
 
 def update_bm25_index(documents: List[Document], user_id: int = None) -> None:
     """
     Update the BM25 index with new documents.
     
+    Writes a new segment to the user's on-disk store; processes that have the
+    index loaded pick it up on their next search. The writer does not need to
+    load the index itself.
+    
     Args:
         documents: Documents to add
         user_id: User ID for index isolation
     """
-    index = get_bm25_index(user_id)
-    index.add_documents(documents)
+    BM25SegmentStore(user_id).append(documents)
+
+
+def delete_from_bm25_index(file_path: str, user_id: int = None) -> int:
+    """
+    Remove a document's chunks from a user's BM25 index.
+    
+    Records a tombstone in the on-disk store (compacting if enough chunks are
+    dead); processes that have the index loaded apply it on their next search.
+    
+    Args:
+        file_path: The document's file_path metadata value
+        user_id: User ID for index isolation
+    
+    Returns:
+        Number of chunks tombstoned
+    """
+    return BM25SegmentStore(user_id).delete_file(file_path)
+
+
+def reset_bm25_index(user_id: int = None) -> None:
+    """
+    Drop a user's BM25 index, or every index when user_id is None.
+    
+    Args:
+        user_id: User ID for index isolation
+    """
+    stores = [BM25SegmentStore(user_id)] if user_id else BM25SegmentStore.all_stores()
+    for store in stores:
+        store.reset()
 
 
 def create_hybrid_retriever(
     vector_retriever,
     user_id: int = None,
     semantic_weight: float = 0.6,
-    bm25_weight: float = 0.4
+    bm25_weight: float = 0.4,
+    k: int = 5,
+    fetch_k: int = None,
+    fusion: str = None
 ) -> HybridRetriever:
     """
     Create a hybrid retriever combining vector search and BM25.
     
     Args:
         vector_retriever: LangChain vector store retriever
-        user_id: User ID for BM25 index isolation
+        user_id: User ID for keyword index isolation
         semantic_weight: Weight for semantic results
         bm25_weight: Weight for BM25 results
+        k: Number of fused documents to return
+        fetch_k: Candidates fetched from each leg (default k * HYBRID_FETCH_K_MULTIPLIER)
+        fusion: 'rrf', 'combsum' or 'combmnz' (default HYBRID_FUSION_METHOD)
     
     Returns:
         HybridRetriever instance
     """
-    bm25_index = get_bm25_index(user_id)
     return HybridRetriever(
         vector_retriever=vector_retriever,
-        bm25_index=bm25_index,
+        user_id=user_id,
         semantic_weight=semantic_weight,
-        bm25_weight=bm25_weight
+        bm25_weight=bm25_weight,
+        k=k,
+        fetch_k=fetch_k,
+        fusion=fusion or FUSION_METHOD
     )
@@ -0,0 +1,146 @@
+"""
+Keyword Retrieval Backends for KnowBot 2.0
+
+The keyword leg of hybrid search runs against one of:
+- bm25:     the user's BM25 segment store, loaded into each process's memory
+            (see hybrid_search.PersistentBM25Index)
+- postgres: Postgres full-text search over the Chunk registry, a tsvector
+            column with a GIN index ranked with ts_rank_cd, shared by every
+            Django and Celery process with nothing to rebuild in memory
+
+Both expose search(query, k) -> [(Document, score)], so HybridRetriever
+treats them the same. The backend is selected with settings.KEYWORD_BACKEND.
+"""
+
+import operator
+from functools import reduce
+from typing import List, Optional
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F
+from langchain_core.documents import Document
+
+
+KEYWORD_BACKEND = getattr(settings, 'KEYWORD_BACKEND', 'bm25')  # bm25, postgres
+KEYWORD_SEARCH_CONFIG = getattr(settings, 'KEYWORD_SEARCH_CONFIG', 'english')
+# Distinct query terms OR-ed into one tsquery
+KEYWORD_MAX_QUERY_TERMS = int(getattr(settings, 'KEYWORD_MAX_QUERY_TERMS', 32))
+
+KEYWORD_BACKENDS = ('bm25', 'postgres')
+
+
+def is_postgres_search_available() -> bool:
+    """Whether the default database can run full-text search (Postgres only)."""
+    return connection.vendor == 'postgresql'
+
+
+def active_keyword_backend() -> str:
+    """
+    The keyword backend in effect.
+
+    Falls back to 'bm25' when 'postgres' is configured but the database is
+    not Postgres (e.g. a SQLite development setup).
+    """
+    if KEYWORD_BACKEND not in KEYWORD_BACKENDS:
+        raise ValueError(f"Unknown keyword backend: {KEYWORD_BACKEND}")
+    if KEYWORD_BACKEND == 'postgres' and not is_postgres_search_available():
+        return 'bm25'
+    return KEYWORD_BACKEND
+
+
+def update_search_vectors(chunks) -> int:
+    """
+    Compute search_vector for Chunk rows from their stored content.
+
+    Only done while the postgres backend is active, so BM25 deployments don't
+    pay for the tsvector and its GIN index. Switching KEYWORD_BACKEND to
+    'postgres' therefore needs a reindex (reindex_all_documents_task) to fill
+    search_vector for existing chunks.
+
+    Args:
+        chunks: Chunk queryset (e.g. document.chunks.all())
+
+    Returns:
+        Number of rows updated (0 unless the postgres backend is active)
+    """
+    if active_keyword_backend() != 'postgres':
+        return 0
+    return chunks.update(search_vector=SearchVector('content', config=KEYWORD_SEARCH_CONFIG))
+
+
+class PostgresKeywordIndex:
+    """
+    Keyword search over one user's chunks in Postgres.
+
+    Query terms are OR-ed, so (as with BM25) a chunk needs only one of them,
+    and matches are ranked with ts_rank_cd, which also rewards chunks where
+    the terms occur close together. Chunk rows are replaced atomically on
+    (re)index and cascade-deleted with their Document, so there are no
+    tombstones or segments to refresh.
+    """
+
+    def __init__(self, user_id: int = None, config: str = KEYWORD_SEARCH_CONFIG):
+        """
+        Args:
+            user_id: Owner whose chunks are searched
+            config: Postgres text search configuration (must match the one
+                used by update_search_vectors)
+        """
+        self.user_id = user_id
+        self.config = config
+
+    def build_query(self, query: str) -> Optional[SearchQuery]:
+        """OR of the query's distinct terms, or None if it has none."""
+        from rag.hybrid_search import tokenize
+
+        terms = list(dict.fromkeys(tokenize(query)))[:KEYWORD_MAX_QUERY_TERMS]
+        if not terms:
+            return None
+        return reduce(operator.or_, (SearchQuery(term, config=self.config) for term in terms))
+
+    def queryset(self, search_query: SearchQuery):
+        """The user's matching chunks, best ranked first."""
+        from api.models import Chunk, Document as DocumentModel
+
+        # Chunk rows are written window by window while a document is processed
+        # (and stay partial if it fails); only serve fully indexed documents
+        chunks = Chunk.objects.filter(
+            search_vector=search_query,
+            document__index_status=DocumentModel.IndexStatus.INDEXED,
+        )
+        if self.user_id is not None:
+            chunks = chunks.filter(document__user_id=self.user_id)
+        else:
+            chunks = chunks.filter(document__user__isnull=True)
+        return chunks.annotate(
+            rank=SearchRank(F('search_vector'), search_query, cover_density=True)
+        ).order_by('-rank', 'id')
+
+    def search(self, query: str, k: int = 10) -> List[tuple]:
+        """
+        Search the user's chunks.
+
+        Args:
+            query: Search query string
+            k: Number of results to return
+
+        Returns:
+            List of (document, score) tuples
+        """
+        search_query = self.build_query(query)
+        if search_query is None or k <= 0:
+            return []
+
+        try:
+            rows = list(self.queryset(search_query).values_list('vector_id', 'content', 'metadata', 'rank')[:k])
+        finally:
+            # May run on retrieval pool threads, which Django never cleans up
+            # after; close so each thread doesn't hold its own idle connection
+            if not connection.in_atomic_block:
+                connection.close()
+        return [
+            (Document(id=vector_id, page_content=content, metadata=metadata), float(rank))
+            for vector_id, content, metadata, rank in rows
+        ]
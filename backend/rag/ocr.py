@@ -2,17 +2,33 @@
 OCR Processor Module for KnowBot 2.0
 
 Handles text extraction from scanned PDFs and images using Tesseract OCR.
+Scanned PDFs are rasterized a few pages at a time and those pages are OCR'd in
+parallel on a per-process worker pool, so results stream out page by page.
+Tesseract output is cached per (file hash, page, DPI, language), so retries
+and reindexes of unchanged files skip OCR.
 """
 
+import hashlib
+import multiprocessing
 import os
+import sqlite3
 import tempfile
+import time
+import threading
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Dict, Optional, Iterable, Iterator
+
+from django.conf import settings
+
+from rag.storage import SQLiteCache
 
 try:
     import pytesseract
     from PIL import Image
-    from pdf2image import convert_from_path
+    from pdf2image import convert_from_path, pdfinfo_from_path
     import magic
     OCR_AVAILABLE = True
 except ImportError:
@@ -20,6 +36,31 @@ except ImportError:
     print("Warning: OCR libraries not available. Scanned document support disabled.")
 
 
+# Pages of one document OCR'd at the same time
+OCR_WORKERS = int(getattr(settings, 'OCR_WORKERS', min(4, os.cpu_count() or 1)))
+# Size of the shared pool: total OCR concurrency of this (Celery worker) process.
+# Each prefork child has its own pool, so by default the CPUs are split between them.
+CELERY_WORKER_CONCURRENCY = int(getattr(settings, 'CELERY_WORKER_CONCURRENCY', os.cpu_count() or 1))
+OCR_MAX_CONCURRENCY = int(getattr(
+    settings, 'OCR_MAX_CONCURRENCY', max(1, (os.cpu_count() or 1) // CELERY_WORKER_CONCURRENCY)
+))
+# Pages whose text layer has fewer characters than this are OCR'd
+OCR_PAGE_MIN_CHARS = int(getattr(settings, 'OCR_PAGE_MIN_CHARS', 50))
+# Pages rasterized per pdftoppm call (rendered images on disk at once ~ this + OCR_WORKERS)
+OCR_RASTER_WINDOW = int(getattr(settings, 'OCR_RASTER_WINDOW', 4))
+
+OCR_CACHE_ENABLED = getattr(settings, 'OCR_CACHE_ENABLED', True)
+OCR_CACHE_PATH = str(getattr(settings, 'OCR_CACHE_PATH', './ocr_cache/ocr.sqlite3'))
+# Cached pages kept before the least recently used are evicted
+OCR_CACHE_MAX_ENTRIES = int(getattr(settings, 'OCR_CACHE_MAX_ENTRIES', 100_000))
+
+_MAGIC_LOCAL = threading.local()
+
+_OCR_POOL: Optional[Executor] = None
+_OCR_POOL_PID = None
+_OCR_POOL_LOCK = threading.Lock()
+
+
 def is_ocr_available() -> bool:
     """Check if OCR dependencies are installed."""
     return OCR_AVAILABLE
@@ -42,7 +83,10 @@ def get_file_mime_type(file_path: str) -> str:
         }
         return mime_map.get(ext, 'application/octet-stream')
     
-    mime = magic.Magic(mime=True)
+    # libmagic handles aren't thread-safe, so keep one per thread
+    mime = getattr(_MAGIC_LOCAL, 'mime', None)
+    if mime is None:
+        mime = _MAGIC_LOCAL.mime = magic.Magic(mime=True)
     return mime.from_file(file_path)
 
 
@@ -58,6 +102,36 @@ def is_pdf_file(file_path: str) -> bool:
     return mime_type == 'application/pdf'
 
 
+class DocumentProbe:
+    """
+    One-time inspection of a file shared by every later indexing stage.
+
+    Detects the MIME type once, and for PDFs opens and parses the file once:
+    the reader is created lazily and shared by OCR routing and page metadata.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = str(file_path)
+        self.mime_type = get_file_mime_type(self.file_path)
+        self._reader = None
+
+    @property
+    def is_image(self) -> bool:
+        return self.mime_type.startswith('image/')
+
+    @property
+    def is_pdf(self) -> bool:
+        return self.mime_type == 'application/pdf'
+
+    @property
+    def reader(self):
+        """Parsed pypdf.PdfReader (PDFs only)."""
+        if self._reader is None:
+            from pypdf import PdfReader
+            self._reader = PdfReader(self.file_path)
+        return self._reader
+
+
 def is_pdf_scanned(file_path: str) -> bool:
     """
     Check if a PDF is scanned (image-based) by attempting to extract text.
@@ -84,6 +158,113 @@ def is_pdf_scanned(file_path: str) -> bool:
         return True
 
 
+def file_sha256(file_path: str) -> str:
+    """SHA-256 of a file's bytes, read in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class OCRCache(SQLiteCache):
+    """
+    SQLite-backed store of Tesseract output per (file hash, page, DPI, language).
+
+    Keyed by the source file's content rather than its path, so a re-uploaded
+    copy of a scanned PDF reuses the text OCR'd for the original. Pages are
+    evicted least recently used first once there are more than max_entries.
+    """
+
+    table = 'ocr_pages'
+    label = 'OCR cache'
+
+    def __init__(self, path: str = OCR_CACHE_PATH, max_entries: int = OCR_CACHE_MAX_ENTRIES):
+        super().__init__(path, max_entries)
+
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ocr_pages ("
+            " file_hash TEXT NOT NULL, page INTEGER NOT NULL, dpi INTEGER NOT NULL,"
+            " language TEXT NOT NULL, text TEXT NOT NULL, created REAL NOT NULL,"
+            " last_used REAL NOT NULL, PRIMARY KEY (file_hash, page, dpi, language))"
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(ocr_pages)")}
+        if 'last_used' not in columns:
+            # Caches created before eviction existed
+            conn.execute("ALTER TABLE ocr_pages ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+            conn.execute("UPDATE ocr_pages SET last_used = created")
+        conn.execute("CREATE INDEX IF NOT EXISTS ocr_pages_last_used ON ocr_pages (last_used)")
+
+    def get_many(self, file_hash: str, pages: List[int], dpi: int, language: str) -> Dict[int, str]:
+        """Cached text by page number for the pages that have an entry; touches hits for LRU."""
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT page, text FROM ocr_pages WHERE file_hash = ? AND dpi = ? AND language = ?",
+            (file_hash, dpi, language)
+        ).fetchall()
+        wanted = set(pages)
+        found = {page: text for page, text in rows if page in wanted}
+        if found:
+            now = time.time()
+            with conn:
+                conn.executemany(
+                    "UPDATE ocr_pages SET last_used = ?"
+                    " WHERE file_hash = ? AND page = ? AND dpi = ? AND language = ?",
+                    [(now, file_hash, page, dpi, language) for page in found]
+                )
+        return found
+
+    def put(self, file_hash: str, page: int, dpi: int, language: str, text: str) -> None:
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ocr_pages (file_hash, page, dpi, language, text, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file_hash, page, dpi, language, text, now, now)
+            )
+        self._evict(conn)
+
+
+_OCR_CACHE: Optional[OCRCache] = None
+_OCR_CACHE_LOCK = threading.Lock()
+
+
+def get_ocr_cache() -> Optional[OCRCache]:
+    """Process-wide OCRCache, or None if disabled."""
+    global _OCR_CACHE
+    if not OCR_CACHE_ENABLED:
+        return None
+    with _OCR_CACHE_LOCK:
+        if _OCR_CACHE is None:
+            _OCR_CACHE = OCRCache()
+        return _OCR_CACHE
+
+
+def _cached_pages(file_path: str, pages: List[int], dpi: int, language: str,
+                  file_hash: Optional[str] = None) -> tuple:
+    """(file hash, {page: text}) from the OCR cache; (None, {}) if disabled or unreadable."""
+    cache = get_ocr_cache()
+    if cache is None:
+        return None, {}
+    try:
+        file_hash = file_hash or file_sha256(file_path)
+        return file_hash, cache.get_many(file_hash, pages, dpi, language)
+    except sqlite3.Error as e:
+        print(f"OCR cache read failed: {e}")
+        return None, {}
+
+
+def _cache_page(file_hash: Optional[str], page: int, dpi: int, language: str, text: str) -> None:
+    if file_hash is None:
+        return
+    try:
+        get_ocr_cache().put(file_hash, page, dpi, language, text)
+    except sqlite3.Error as e:
+        print(f"OCR cache write failed: {e}")
+
+
 def extract_text_from_image(image_path: str, language: str = 'eng') -> str:
     """
     Extract text from an image file using Tesseract OCR.
@@ -98,6 +279,12 @@ def extract_text_from_image(image_path: str, language: str = 'eng') -> str:
     if not OCR_AVAILABLE:
         raise RuntimeError("OCR libraries not installed. Install pytesseract and Pillow.")
     
+    # Images are cached as page 1 at their native resolution (dpi 0)
+    file_hash, cached = _cached_pages(image_path, [1], 0, language)
+    if 1 in cached:
+        print(f"OCR cache hit for image: {image_path}")
+        return cached[1]
+    
     try:
         print(f"DEBUG: Starting OCR for image: {image_path}")
         image = Image.open(image_path)
@@ -111,74 +298,321 @@ def extract_text_from_image(image_path: str, language: str = 'eng') -> str:
         text = pytesseract.image_to_string(image, lang=language)
         print(f"DEBUG: OCR Extraction complete. Text length: {len(text.strip())}")
         print(f"DEBUG: First 50 chars: {text.strip()[:50]}")
-        return text.strip()
     
     except Exception as e:
         raise RuntimeError(f"OCR extraction failed for {image_path}: {e}")
+    
+    _cache_page(file_hash, 1, 0, language, text.strip())
+    return text.strip()
 
 
-def extract_text_from_pdf_ocr(pdf_path: str, language: str = 'eng', dpi: int = 300) -> List[dict]:
+def _init_ocr_worker() -> None:
     """
-    Extract text from a scanned PDF using OCR.
-    Converts each page to an image and applies Tesseract.
+    Keep each Tesseract run single-threaded.
+
+    Tesseract's OpenMP build otherwise starts a thread per core for every
+    page, oversubscribing the CPUs the pool already parallelizes over.
+    Child tesseract processes inherit the variable from the pool worker.
+    """
+    os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+
+def get_ocr_pool() -> Executor:
+    """Process-wide OCR pool with OCR_MAX_CONCURRENCY workers (recreated after fork)."""
+    global _OCR_POOL, _OCR_POOL_PID
+    with _OCR_POOL_LOCK:
+        if _OCR_POOL is None or _OCR_POOL_PID != os.getpid():
+            if multiprocessing.current_process().daemon:
+                # Daemonic processes can't have children; tesseract runs as its
+                # own subprocess, so threads still OCR pages in parallel
+                _OCR_POOL = ThreadPoolExecutor(
+                    max_workers=OCR_MAX_CONCURRENCY, thread_name_prefix='ocr',
+                    initializer=_init_ocr_worker
+                )
+            else:
+                _OCR_POOL = ProcessPoolExecutor(
+                    max_workers=OCR_MAX_CONCURRENCY, initializer=_init_ocr_worker
+                )
+            _OCR_POOL_PID = os.getpid()
+        return _OCR_POOL
+
+
+def _reset_ocr_pool() -> None:
+    global _OCR_POOL
+    with _OCR_POOL_LOCK:
+        _OCR_POOL = None
+
+
+def _ocr_page_image(image_path: str, language: str) -> str:
+    """OCR one rendered page image (runs inside the OCR pool)."""
+    with Image.open(image_path) as image:
+        return pytesseract.image_to_string(image, lang=language).strip()
+
+
+def _remove_image(image_path: str) -> None:
+    try:
+        os.unlink(image_path)
+    except FileNotFoundError:
+        pass
+
+
+def iter_ocr_page_images(image_paths: Iterable[str], language: str = 'eng',
+                         workers: int = OCR_WORKERS, remove_images: bool = False) -> Iterator[str]:
+    """
+    OCR page images in parallel, yielding their text in page order.
+    
+    image_paths is consumed lazily (at most `workers` pages ahead), so it can
+    be a generator that renders pages on demand.
+    
+    Args:
+        image_paths: Rendered page images, in page order
+        language: Tesseract language code
+        workers: Max pages of this document in flight at once (1 = sequential)
+        remove_images: Delete each image file as soon as it has been OCR'd
+    
+    Yields:
+        Extracted text of each page, in the order of image_paths
+    """
+    if workers <= 1:
+        for image_path in image_paths:
+            text = _ocr_page_image(image_path, language)
+            if remove_images:
+                _remove_image(image_path)
+            yield text
+        return
+    
+    def finish_oldest() -> str:
+        image_path, future = in_flight.popleft()
+        text = future.result()
+        if remove_images:
+            _remove_image(image_path)
+        return text
+    
+    pool = get_ocr_pool()
+    in_flight = deque()
+    try:
+        for image_path in image_paths:
+            in_flight.append((image_path, pool.submit(_ocr_page_image, image_path, language)))
+            if len(in_flight) >= workers:
+                yield finish_oldest()
+        while in_flight:
+            yield finish_oldest()
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM); start a fresh pool next time
+        _reset_ocr_pool()
+        raise
+    finally:
+        for _, future in in_flight:
+            future.cancel()
+
+
+def get_pdf_page_count(pdf_path: str) -> int:
+    """Number of pages in a PDF (via poppler's pdfinfo)."""
+    return int(pdfinfo_from_path(pdf_path)["Pages"])
+
+
+def _page_windows(pages: List[int], window: int) -> Iterator[tuple]:
+    """Split sorted page numbers into (first, last) runs of consecutive pages, at most `window` long."""
+    start = None
+    for page in pages:
+        if start is None:
+            start = end = page
+        elif page == end + 1 and page - start < window:
+            end = page
+        else:
+            yield start, end
+            start = end = page
+    if start is not None:
+        yield start, end
+
+
+def iter_pdf_page_images(pdf_path: str, output_folder: str, dpi: int = 300,
+                         window: int = OCR_RASTER_WINDOW, pages: Optional[List[int]] = None) -> Iterator[str]:
+    """
+    Rasterize a PDF lazily, up to `window` pages per pdftoppm call.
+    
+    Args:
+        pdf_path: Path to the PDF file
+        output_folder: Directory the PNGs are written to
+        dpi: Rendering resolution
+        window: Pages rendered per call
+        pages: 1-based page numbers to render (default: all pages)
+    
+    Yields:
+        Paths of the rendered page images, in page order
+    """
+    if pages is None:
+        pages = range(1, get_pdf_page_count(pdf_path) + 1)
+    for first_page, last_page in _page_windows(sorted(pages), window):
+        # Rendered file names sort in page order within one call
+        yield from sorted(convert_from_path(
+            pdf_path,
+            dpi=dpi,
+            output_folder=output_folder,
+            fmt='png',
+            first_page=first_page,
+            last_page=last_page,
+            paths_only=True
+        ))
+
+
+def iter_text_from_pdf_ocr(pdf_path: str, language: str = 'eng', dpi: int = 300,
+                           workers: int = OCR_WORKERS, pages: Optional[List[int]] = None,
+                           file_hash: Optional[str] = None) -> Iterator[dict]:
+    """
+    Stream OCR results of a scanned PDF page by page.
+    
+    Pages are rendered OCR_RASTER_WINDOW at a time, OCR'd in parallel and
+    deleted as soon as their text is extracted, so memory and temp disk use
+    are bounded by the window and page 1 is OCR'd while later pages render.
+    Pages found in the OCR cache are neither rendered nor OCR'd.
     
     Args:
         pdf_path: Path to the PDF file
         language: Tesseract language code (default: 'eng')
         dpi: Resolution for PDF to image conversion (higher = better but slower)
+        workers: Pages OCR'd in parallel (default: settings.OCR_WORKERS)
+        pages: 1-based page numbers to OCR (default: all pages)
+        file_hash: SHA-256 of the PDF when the caller already has it
     
-    Returns:
-        List of dicts with 'page' and 'text' for each page
+    Yields:
+        Dicts with 'page' and 'text', in page order
     """
     if not OCR_AVAILABLE:
         raise RuntimeError("OCR libraries not installed. Install pytesseract, Pillow, and pdf2image.")
     
-    results = []
-    
     try:
-        # Convert PDF pages to images
         with tempfile.TemporaryDirectory() as temp_dir:
-            images = convert_from_path(
-                pdf_path,
-                dpi=dpi,
-                output_folder=temp_dir,
-                fmt='png'
-            )
+            # Workers read the rendered files, so only paths cross processes
+            if pages is None:
+                pages = list(range(1, get_pdf_page_count(pdf_path) + 1))
+            pages = sorted(pages)
             
-            for page_num, image in enumerate(images, start=1):
-                # Apply OCR to each page image
-                text = pytesseract.image_to_string(image, lang=language)
-                
-                results.append({
+            file_hash, cached = _cached_pages(pdf_path, pages, dpi, language, file_hash)
+            missing = [page_num for page_num in pages if page_num not in cached]
+            if cached:
+                print(f"OCR cache: {len(cached)}/{len(pages)} pages cached for {pdf_path}")
+            
+            image_paths = iter_pdf_page_images(pdf_path, temp_dir, dpi=dpi, pages=missing)
+            fresh = zip(missing, iter_ocr_page_images(image_paths, language, workers, remove_images=True))
+            for page_num in pages:
+                if page_num in cached:
+                    text = cached[page_num]
+                else:
+                    _, text = next(fresh)
+                    _cache_page(file_hash, page_num, dpi, language, text)
+                    print(f"OCR processed page {page_num}/{pages[-1]}")
+                yield {
                     'page': page_num,
-                    'text': text.strip()
-                })
-                
-                print(f"OCR processed page {page_num}/{len(images)}")
-        
-        return results
+                    'text': text
+                }
     
     except Exception as e:
         raise RuntimeError(f"PDF OCR extraction failed for {pdf_path}: {e}")
 
 
-def process_document_with_ocr(file_path: str, language: str = 'eng') -> List[dict]:
+def extract_text_from_pdf_ocr(pdf_path: str, language: str = 'eng', dpi: int = 300,
+                              workers: int = OCR_WORKERS) -> List[dict]:
+    """
+    Extract text from a scanned PDF using OCR.
+    Converts each page to an image and applies Tesseract, several pages at once.
+    
+    Args:
+        pdf_path: Path to the PDF file
+        language: Tesseract language code (default: 'eng')
+        dpi: Resolution for PDF to image conversion (higher = better but slower)
+        workers: Pages OCR'd in parallel (default: settings.OCR_WORKERS)
+    
+    Returns:
+        List of dicts with 'page' and 'text' for each page
+    """
+    return list(iter_text_from_pdf_ocr(pdf_path, language, dpi, workers))
+
+
+def _pdf_page_text(page) -> str:
+    """Text layer of one pypdf page ('' if it has none or can't be read)."""
+    try:
+        return (page.extract_text() or "").strip()
+    except Exception as e:
+        print(f"Error extracting text from PDF page: {e}")
+        return ""
+
+
+def iter_pdf_pages(file_path: str, reader, language: str = 'eng',
+                   window: int = OCR_RASTER_WINDOW) -> Iterator[dict]:
+    """
+    Route a PDF between its text layer and OCR page by page, lazily.
+    
+    Pages are read `window` at a time: each page's text layer is extracted,
+    those with fewer than OCR_PAGE_MIN_CHARS characters are OCR'd together
+    (one pdftoppm call), and the window is yielded in page order before the
+    next one is read, so only one window of page text is held at once.
+    
+    Args:
+        file_path: Path to the PDF
+        reader: Its parsed pypdf.PdfReader
+        language: OCR language
+        window: Pages read (and at most rasterized) per step
+    
+    Yields:
+        Dicts with 'page', 'text', 'source' and 'ocr_applied'
+    """
+    name = Path(file_path).name
+    total_pages = len(reader.pages)
+    file_hash = None
+    ocr_count = 0
+    for first_page in range(1, total_pages + 1, window):
+        texts = {
+            page_num: _pdf_page_text(reader.pages[page_num - 1])
+            for page_num in range(first_page, min(first_page + window, total_pages + 1))
+        }
+        ocr_pages = [page_num for page_num, text in texts.items() if len(text) < OCR_PAGE_MIN_CHARS]
+        if ocr_pages:
+            # Hash the file once, for the OCR cache, and only if a page needs OCR
+            if file_hash is None and get_ocr_cache() is not None:
+                file_hash = file_sha256(file_path)
+            for result in iter_text_from_pdf_ocr(file_path, language, pages=ocr_pages, file_hash=file_hash):
+                texts[result['page']] = result['text']
+            ocr_count += len(ocr_pages)
+        
+        for page_num, text in texts.items():
+            yield {
+                'page': page_num,
+                'text': text,
+                'source': name,
+                'ocr_applied': page_num in ocr_pages
+            }
+    
+    if ocr_count:
+        print(f"Applied OCR to {ocr_count}/{total_pages} scanned pages of {name}")
+
+
+def process_document_with_ocr(file_path: str, language: str = 'eng',
+                              probe: Optional[DocumentProbe] = None) -> Iterable[dict]:
     """
     Process a document (image or PDF) using OCR if needed.
     
+    PDFs are routed page by page as they are read: pages with a text layer
+    keep their native text and only pages without one are rasterized and
+    OCR'd (see iter_pdf_pages).
+    
     Args:
         file_path: Path to the document
         language: OCR language
+        probe: DocumentProbe of the file, to reuse its MIME type and parsed PDF
     
     Returns:
-        List of dicts with extracted text and metadata
+        Dicts with extracted text and metadata (a lazy page-ordered iterator
+        for PDFs, pages are read and OCR'd as it is consumed)
     """
     path = Path(file_path)
     
     if not path.exists():
         raise FileNotFoundError(f"File not found: {file_path}")
     
-    if is_image_file(file_path):
+    probe = probe or DocumentProbe(file_path)
+    
+    if probe.is_image:
         # Direct image file
         text = extract_text_from_image(file_path, language)
         return [{
@@ -188,20 +622,18 @@ def process_document_with_ocr(file_path: str, language: str = 'eng') -> List[dic
             'ocr_applied': True
         }]
     
-    elif is_pdf_file(file_path):
-        if is_pdf_scanned(file_path):
-            # Scanned PDF - use OCR
-            print(f"Detected scanned PDF: {path.name}, applying OCR...")
-            pages = extract_text_from_pdf_ocr(file_path, language)
-            return [{
-                'page': p['page'],
-                'text': p['text'],
-                'source': str(path.name),
-                'ocr_applied': True
-            } for p in pages]
-        else:
-            # Native text PDF - return None to signal standard processing
-            return None
+    elif probe.is_pdf:
+        try:
+            reader = probe.reader
+            len(reader.pages)
+        except Exception as e:
+            print(f"Error reading PDF: {e}")
+            # If we can't read it normally, OCR every page
+            print(f"Applying OCR to unreadable PDF: {path.name}")
+            return ({**p, 'source': str(path.name), 'ocr_applied': True}
+                    for p in iter_text_from_pdf_ocr(file_path, language))
+        
+        return iter_pdf_pages(file_path, reader, language)
     
     else:
         raise ValueError(f"Unsupported file type for OCR: {path.suffix}")
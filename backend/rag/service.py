@@ -3,40 +3,56 @@ RAG Service - Migrated from Streamlit rag_chain.py
 
 This module provides the core RAG functionality:
 - Document loading and chunking
-- Vector store management (ChromaDB)
+- Vector store management (ChromaDB or the in-process NumPy backend)
 - RAG chain building and execution
 
 Refactored to use chromadb.PersistentClient to fix HNSW index errors.
 """
 
 import os
+import threading
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterable, Iterator
 
 from django.conf import settings
 
 import chromadb
 from langchain_ollama import OllamaEmbeddings, ChatOllama
-from langchain_chroma import Chroma
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.documents import Document as LangchainDocument
+from langchain_core.vectorstores import VectorStore
 
 # OCR support for scanned documents
 try:
-    from rag.ocr import process_document_with_ocr, is_ocr_available, is_image_file
+    from rag.ocr import process_document_with_ocr, is_ocr_available, is_image_file, DocumentProbe
     OCR_ENABLED = is_ocr_available()
 except ImportError:
     OCR_ENABLED = False
     print("Warning: OCR module not available")
 
+from rag.vector_backends import VECTOR_BACKEND, ChromaBackend, NumpyBackend, VectorBackend
+from rag.keyword_backends import active_keyword_backend
+from rag.embeddings import (
+    CachedEmbeddings, MicroBatchedEmbeddings, get_embedding_cache, get_query_batcher
+)
+from rag.cache import (
+    AnswerCache, ANSWER_CACHE_ENABLED, QUERY_EMBEDDING_CACHE, RETRIEVAL_CACHE,
+    RETRIEVAL_CACHE_ENABLED, retrieval_cache_key
+)
+
 # Hybrid search (BM25 + Semantic)
 try:
     from rag.hybrid_search import (
-        is_bm25_available, update_bm25_index, create_hybrid_retriever, get_bm25_index
+        is_bm25_available, update_bm25_index, create_hybrid_retriever, get_bm25_index,
+        delete_from_bm25_index, reset_bm25_index
     )
     HYBRID_SEARCH_ENABLED = is_bm25_available()
 except ImportError:
@@ -52,6 +68,33 @@ LLM_MODEL = getattr(settings, 'LLM_MODEL', 'llama3.1:8b')
 CHROMA_DIR = str(getattr(settings, 'CHROMA_DIR', './chroma_db'))
 DATA_DIR = str(getattr(settings, 'DATA_DIR', './data'))
 OLLAMA_HOST = getattr(settings, 'OLLAMA_HOST', 'http://localhost:11434')
+RAG_ENGINE_POOL_SIZE = int(getattr(settings, 'RAG_ENGINE_POOL_SIZE', 64))
+EMBEDDING_CACHE_ENABLED = getattr(settings, 'EMBEDDING_CACHE_ENABLED', True)
+QUERY_EMBEDDING_BATCHING = getattr(settings, 'QUERY_EMBEDDING_BATCHING', True)
+# Chunks per embed call while indexing, and how many such calls run at once
+INDEX_EMBED_BATCH_SIZE = int(getattr(settings, 'INDEX_EMBED_BATCH_SIZE', 64))
+INDEX_EMBED_CONCURRENCY = int(getattr(settings, 'INDEX_EMBED_CONCURRENCY', 4))
+# Chunks held in memory at once by the streaming ingestion pipeline
+INGEST_WINDOW_SIZE = int(getattr(settings, 'INGEST_WINDOW_SIZE', 512))
+
+# 'shared': one knowbot_docs collection filtered by user_id metadata
+# 'per_user': one collection per user (see migrate_vector_collections)
+CHROMA_COLLECTION_LAYOUT = getattr(settings, 'CHROMA_COLLECTION_LAYOUT', 'shared')
+SHARED_COLLECTION_NAME = "knowbot_docs"
+
+
+def collection_name_for(user_id: Optional[int], layout: str = None) -> str:
+    """Collection holding a user's chunks under the given (or configured) layout."""
+    layout = layout or CHROMA_COLLECTION_LAYOUT
+    if layout == 'per_user' and user_id is not None:
+        return f"knowbot_user_{user_id}"
+    return SHARED_COLLECTION_NAME
+
+
+def make_chunk_id(file_path: str, ordinal: int) -> str:
+    """Stable id of the ordinal-th chunk of a file (also used as its Chroma vector id)."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{file_path}#{ordinal}"))
+
 
 # Global client singleton to prevent file locking/HNSW errors
 _CHROMA_CLIENT = None
@@ -86,80 +129,126 @@ class DocumentProcessor:
             add_start_index=True,
         )
     
-    def load_single_document(self, file_path: str, user_id: int = None, original_filename: str = None) -> List:
-        """Load a single document and return chunks with user metadata."""
+    def iter_pages(self, file_path: str, source_name: str = None) -> Iterator[LangchainDocument]:
+        """
+        Lazily yield a document's pages (or OCR results) one at a time.
+
+        Args:
+            file_path: Path to the stored file
+            source_name: Friendly name for the 'source' metadata of OCR pages
+
+        Yields:
+            One LangChain Document per page (the whole file for text files)
+        """
         path = Path(file_path)
         
         if not path.exists():
             raise FileNotFoundError(f"File not found: {file_path}")
         
         ext = path.suffix.lower()
-        documents = []
-        
-        # Use provided filename or fallback to path name
-        source_name = original_filename or path.name
+        source_name = source_name or path.name
         
-        # Check if this is an image file - use OCR
-        if ext in ['.png', '.jpg', '.jpeg', '.tiff', '.tif', '.bmp', '.gif']:
-            if not OCR_ENABLED:
-                raise ValueError(f"OCR is required for image files but not available: {ext}")
-            
-            ocr_results = process_document_with_ocr(str(path))
+        def ocr_pages(ocr_results) -> Iterator[LangchainDocument]:
             for result in ocr_results:
-                doc = LangchainDocument(
+                yield LangchainDocument(
                     page_content=result['text'],
                     metadata={
                         'source': source_name,
                         'file_path': str(path),
                         'page': result.get('page', 1),
-                        'ocr_applied': True
+                        'ocr_applied': result.get('ocr_applied', True)
                     }
                 )
-                documents.append(doc)
+        
+        # Check if this is an image file - use OCR
+        if ext in ['.png', '.jpg', '.jpeg', '.tiff', '.tif', '.bmp', '.gif']:
+            if not OCR_ENABLED:
+                raise ValueError(f"OCR is required for image files but not available: {ext}")
+            
+            yield from ocr_pages(process_document_with_ocr(str(path)))
         
         elif ext == '.pdf':
-            # Try OCR first for scanned PDFs
-            if OCR_ENABLED:
-                ocr_results = process_document_with_ocr(str(path))
-                if ocr_results is not None:  # None means PDF has native text
-                    print(f"Using OCR for scanned PDF: {path.name}")
-                    for result in ocr_results:
-                        doc = LangchainDocument(
-                            page_content=result['text'],
-                            metadata={
-                                'source': source_name,
-                                'file_path': str(path),
-                                'page': result.get('page', 1),
-                                'ocr_applied': True
-                            }
-                        )
-                        documents.append(doc)
+            if not OCR_ENABLED:
+                # Standard PDF loader, one page at a time
+                yield from PyPDFLoader(str(path)).lazy_load()
+                return
             
-            # If no OCR results, use standard PDF loader
-            if not documents:
-                loader = PyPDFLoader(str(path))
-                documents = loader.load()
+            # Detect the type and parse the PDF once for OCR routing and metadata
+            probe = DocumentProbe(str(path))
+            # Pages without a text layer are OCR'd as they are reached, the rest keep native text
+            yield from self._pdf_page_metadata(
+                ocr_pages(process_document_with_ocr(str(path), probe=probe)), probe
+            )
         
         elif ext in ['.txt', '.md']:
-            loader = TextLoader(str(path))
-            documents = loader.load()
+            yield from TextLoader(str(path)).lazy_load()
         
         else:
             raise ValueError(f"Unsupported file type: {ext}")
+    
+    @staticmethod
+    def _pdf_page_metadata(pages: Iterable[LangchainDocument], probe) -> Iterator[LangchainDocument]:
+        """
+        Give routed PDF pages the page metadata PyPDFLoader produces.
         
-        chunks = self.text_splitter.split_documents(documents)
-        
-        # Add metadata locally
-        for chunk in chunks:
-            # Ensure source is the friendly name, not the UUID path
-            chunk.metadata['source'] = source_name
-            chunk.metadata['file_path'] = str(path)
-            
-            # Add user_id for filtering
-            if user_id is not None:
-                chunk.metadata['user_id'] = str(user_id)
+        Routing numbers pages from 1; PDF chunks everywhere else use
+        PyPDFLoader's 0-based 'page' plus 'page_label' and 'total_pages', so
+        citations match whether or not OCR is enabled.
+        """
+        try:
+            labels = probe.reader.page_labels
+        except Exception:
+            labels = None  # Unreadable PDF, every page was OCR'd
+        for page in pages:
+            number = page.metadata['page']
+            page.metadata['page'] = number - 1
+            if labels is not None:
+                page.metadata['page_label'] = labels[number - 1]
+                page.metadata['total_pages'] = len(labels)
+            else:
+                page.metadata['page_label'] = str(number)
+            yield page
+    
+    def iter_chunks(self, file_path: str, user_id: int = None, original_filename: str = None) -> Iterator[LangchainDocument]:
+        """
+        Stream a document's chunks, splitting each page as it is loaded.
+
+        Memory is bounded by one page plus whatever the consumer holds, so
+        large PDFs and OCR output never have to be fully materialized.
+
+        Args:
+            file_path: Path to the stored file
+            user_id: Owner, added to each chunk's metadata for filtering
+            original_filename: Friendly name used as the 'source' metadata
+
+        Yields:
+            Chunks with source, file_path, chunk_index, chunk_id and user_id metadata
+        """
+        path = Path(file_path)
+        # Use provided filename or fallback to path name
+        source_name = original_filename or path.name
         
-        return chunks
+        ordinal = 0
+        for page in self.iter_pages(file_path, source_name):
+            for chunk in self.text_splitter.split_documents([page]):
+                # Ensure source is the friendly name, not the UUID path
+                chunk.metadata['source'] = source_name
+                chunk.metadata['file_path'] = str(path)
+                
+                # Stable id used for the vector id, fusion and caching
+                chunk.metadata['chunk_index'] = ordinal
+                chunk.metadata['chunk_id'] = make_chunk_id(str(path), ordinal)
+                ordinal += 1
+                
+                # Add user_id for filtering
+                if user_id is not None:
+                    chunk.metadata['user_id'] = str(user_id)
+                
+                yield chunk
+    
+    def load_single_document(self, file_path: str, user_id: int = None, original_filename: str = None) -> List:
+        """Load a single document and return chunks with user metadata."""
+        return list(self.iter_chunks(file_path, user_id=user_id, original_filename=original_filename))
     
     def load_all_documents(self, directory: str = None) -> List:
         """Load all documents from a directory."""
@@ -210,82 +299,208 @@ class DocumentProcessor:
 
 
 class VectorStoreManager:
-    """Manages ChromaDB vector store operations using PersistentClient."""
+    """Manages vector store operations through the configured VectorBackend."""
     
     def __init__(self, persist_directory: str = CHROMA_DIR, user_id: int = None):
         self.persist_directory = persist_directory
         self.user_id = user_id
-        self.collection_name = "knowbot_docs"
+        self.collection_name = collection_name_for(user_id)
+        # A per-user collection only holds its owner's chunks, so no filter is needed
+        self.owns_collection = self.collection_name != SHARED_COLLECTION_NAME
         self.embeddings = OllamaEmbeddings(
             model=EMBEDDING_MODEL,
             base_url=OLLAMA_HOST
         )
+        if QUERY_EMBEDDING_BATCHING:
+            # Concurrent requests' query embeddings go to Ollama as one batch
+            self.embeddings = MicroBatchedEmbeddings(
+                self.embeddings, get_query_batcher(EMBEDDING_MODEL, self.embeddings)
+            )
+        if EMBEDDING_CACHE_ENABLED or RETRIEVAL_CACHE_ENABLED:
+            # Reuse vectors for chunk text / queries that were embedded before
+            self.embeddings = CachedEmbeddings(
+                self.embeddings,
+                model_name=EMBEDDING_MODEL,
+                cache=get_embedding_cache() if EMBEDDING_CACHE_ENABLED else None,
+                query_cache=QUERY_EMBEDDING_CACHE if RETRIEVAL_CACHE_ENABLED else None
+            )
+        self.backend = self._make_backend(VECTOR_BACKEND)
+    
+    def _make_backend(self, name: str) -> VectorBackend:
+        """Backend for this manager's collection ('chroma' or 'numpy')."""
+        if name == 'numpy':
+            return NumpyBackend(self.collection_name, self.embeddings)
+        if name != 'chroma':
+            raise ValueError(f"Unknown vector backend: {name}")
         # Initialize client explicitly using singleton
-        self.client = get_chroma_client(persist_directory)
+        return ChromaBackend(get_chroma_client(self.persist_directory), self.collection_name, self.embeddings)
     
-    def create_vector_store(self, chunks: List) -> Chroma:
+    def create_vector_store(self, chunks: List) -> VectorStore:
         """Create or add to vector store from document chunks."""
         if not chunks:
             raise ValueError("No chunks provided to create vector store")
         
-        # Add user_id to each chunk's metadata if not already set
-        if self.user_id is not None:
-            for chunk in chunks:
-                if 'user_id' not in chunk.metadata:
-                    chunk.metadata['user_id'] = str(self.user_id)
-        
-        vector_store = Chroma(
-            client=self.client,
-            collection_name=self.collection_name,
-            embedding_function=self.embeddings,
-        )
+        added = self.index_chunks(chunks)
+        print(f"Added {added} chunks to vector store for user {self.user_id}")
         
-        vector_store.add_documents(chunks)
-        print(f"Added {len(chunks)} chunks to vector store for user {self.user_id}")
-        
-        # Also update BM25 index for hybrid search
-        if HYBRID_SEARCH_ENABLED:
-            update_bm25_index(chunks, user_id=self.user_id)
-            print(f"Updated BM25 index with {len(chunks)} chunks")
+        return self.backend.as_vectorstore()
+    
+    def index_chunks(self, chunks: Iterable) -> int:
+        """
+        Stream chunks into the vector store and BM25 index in bounded windows.
+
+        Chunks are pulled from the iterable only as fast as the embedding
+        stage drains them, so with a generator (see DocumentProcessor.iter_chunks)
+        memory stays proportional to INGEST_WINDOW_SIZE, not the document.
+
+        Args:
+            chunks: Iterable of LangChain Documents (may be a generator)
+
+        Returns:
+            Number of chunks indexed
+        """
+        # Make sure the collection exists before upserting into it
+        self.backend.create()
+        
+        iterator = iter(chunks)
+        indexed = 0
+        while True:
+            window = list(islice(iterator, INGEST_WINDOW_SIZE))
+            if not window:
+                break
+            
+            # Add user_id to each chunk's metadata if not already set
+            if self.user_id is not None:
+                for chunk in window:
+                    if 'user_id' not in chunk.metadata:
+                        chunk.metadata['user_id'] = str(self.user_id)
+            
+            self.embed_and_upsert(window)
+            
+            # Also update BM25 index for hybrid search (the Postgres keyword
+            # backend reads the Chunk registry instead)
+            if HYBRID_SEARCH_ENABLED and active_keyword_backend() == 'bm25':
+                update_bm25_index(window, user_id=self.user_id)
+                print(f"Updated BM25 index with {len(window)} chunks")
+            
+            indexed += len(window)
         
-        return vector_store
+        return indexed
+    
+    def embed_and_upsert(self, chunks: Iterable) -> int:
+        """
+        Embed chunks in batches and stream each finished batch into the backend.
+
+        Up to INDEX_EMBED_CONCURRENCY batches of INDEX_EMBED_BATCH_SIZE chunks
+        are embedded in parallel; batches are upserted in order as they
+        complete, so memory is bounded by the in-flight batches rather than
+        the size of the document.
+
+        Args:
+            chunks: Iterable of LangChain Documents (may be a generator)
+
+        Returns:
+            Number of chunks upserted
+        """
+        in_flight = deque()
+        upserted = 0
+
+        def upsert_oldest() -> int:
+            batch, future = in_flight.popleft()
+            self.backend.upsert(
+                ids=[chunk.metadata.get('chunk_id') or str(uuid.uuid4()) for chunk in batch],
+                embeddings=future.result(),
+                documents=[chunk.page_content for chunk in batch],
+                metadatas=[chunk.metadata for chunk in batch],
+            )
+            return len(batch)
+
+        iterator = iter(chunks)
+        with ThreadPoolExecutor(max_workers=INDEX_EMBED_CONCURRENCY) as executor:
+            while True:
+                batch = list(islice(iterator, INDEX_EMBED_BATCH_SIZE))
+                if not batch:
+                    break
+                texts = [chunk.page_content for chunk in batch]
+                in_flight.append((batch, executor.submit(self.embeddings.embed_documents, texts)))
+                # Backpressure: wait for the oldest batch before queueing more
+                if len(in_flight) >= INDEX_EMBED_CONCURRENCY:
+                    upserted += upsert_oldest()
+            while in_flight:
+                upserted += upsert_oldest()
+
+        return upserted
     
-    def delete_from_vector_store(self, file_path: str):
-        """Delete all chunks associated with a specific file path."""
+    def delete_from_vector_store(self, file_path: str, vector_ids: Optional[List[str]] = None):
+        """
+        Delete all chunks associated with a specific file path.
+        
+        Args:
+            file_path: The document's stored file path
+            vector_ids: The document's chunk ids from the Chunk registry; when
+                given, vectors are deleted by id instead of by metadata scans
+        """
         try:
-            collection = self.client.get_collection(self.collection_name)
-            # Try deleting by file_path usage in metadata (new schema)
-            collection.delete(where={"file_path": file_path})
-            # Also try deleting by source (legacy/fallback)
-            collection.delete(where={"source": file_path})
+            if vector_ids:
+                ids = list(vector_ids)
+                # Bounded requests for very large documents
+                for start in range(0, len(ids), 1000):
+                    self.backend.delete(ids=ids[start:start + 1000])
+            else:
+                # Try deleting by file_path usage in metadata (new schema)
+                self.backend.delete(where={"file_path": file_path})
+                # Also try deleting by source (legacy/fallback)
+                self.backend.delete(where={"source": file_path})
             print(f"Deleted vectors for {file_path}")
         except Exception as e:
             print(f"Error deleting vectors for {file_path}: {e}")
+        
+        # Keep the BM25 half of hybrid search in sync
+        if HYBRID_SEARCH_ENABLED:
+            try:
+                delete_from_bm25_index(file_path, user_id=self.user_id)
+            except Exception as e:
+                print(f"Error deleting BM25 entries for {file_path}: {e}")
             
+    @property
+    def search_filter(self) -> Optional[Dict[str, str]]:
+        """Metadata filter restricting searches to this user's chunks (None if not needed)."""
+        if self.user_id is None or self.owns_collection:
+            return None
+        return {"user_id": str(self.user_id)}
+    
     def reset_vector_store(self):
         """Delete entire collection for the user."""
         try:
-            collection = self.client.get_collection(self.collection_name)
-            if self.user_id:
-                collection.delete(where={"user_id": str(self.user_id)})
+            if self.owns_collection:
+                self.backend.drop()
+                print(f"Dropped collection {self.collection_name} for user {self.user_id}")
+            elif self.user_id:
+                self.backend.delete(where={"user_id": str(self.user_id)})
                 print(f"Deleted all vectors for user {self.user_id}")
             else:
-                self.client.delete_collection(self.collection_name)
+                self.backend.drop()
                 print("Deleted entire collection")
         except Exception as e:
             print(f"Error resetting vector store: {e}")
+        
+        if HYBRID_SEARCH_ENABLED:
+            try:
+                reset_bm25_index(user_id=self.user_id)
+            except Exception as e:
+                print(f"Error resetting BM25 index: {e}")
+    
+    def get_chunks_by_ids(self, chunk_ids: List[str]) -> List[LangchainDocument]:
+        """Fetch chunks by vector id, in the given order (missing ids are skipped)."""
+        return self.backend.get(list(chunk_ids))
     
-    def load_vector_store(self) -> Chroma:
+    def load_vector_store(self) -> VectorStore:
         """Load existing vector store."""
-        vector_store = Chroma(
-            client=self.client,
-            collection_name=self.collection_name,
-            embedding_function=self.embeddings,
-        )
+        vector_store = self.backend.as_vectorstore()
         print(f"Loaded vector store for user {self.user_id}")
         return vector_store
     
-    def get_or_create_vector_store(self, chunks: List = None) -> Chroma:
+    def get_or_create_vector_store(self, chunks: List = None) -> VectorStore:
         """Get existing vector store or create new one if chunks provided."""
         if chunks:
             return self.create_vector_store(chunks)
@@ -308,9 +523,14 @@ Question: {question}
 
 Answer:"""
     
-    def __init__(self, custom_prompt: Optional[str] = None, user_id: int = None):
+    # Chunks retrieved per question
+    RETRIEVAL_K = 5
+    
+    def __init__(self, custom_prompt: Optional[str] = None, user_id: int = None,
+                 index_version: Optional[str] = None):
         self.custom_prompt = custom_prompt
         self.user_id = user_id
+        self.index_version = index_version
         self.llm = ChatOllama(
             model=LLM_MODEL,
             temperature=0.2,
@@ -318,6 +538,19 @@ Answer:"""
         )
         self.vector_store_manager = VectorStoreManager(user_id=user_id)
         self.indexed_files = self._get_indexed_files()
+        
+        # Built on first query and reused while the engine stays pooled
+        self._retriever = None
+        self._answer_chain = None
+        self._build_lock = threading.Lock()
+        
+        # Answers are only cacheable when we know which knowledge base produced them
+        self.answer_cache = None
+        if ANSWER_CACHE_ENABLED and index_version is not None:
+            self.answer_cache = AnswerCache(
+                user_id, custom_prompt, index_version,
+                embeddings=self.vector_store_manager.embeddings
+            )
     
     def _get_indexed_files(self) -> List[str]:
         """Fetch list of indexed filenames for the user."""
@@ -350,22 +583,24 @@ Answer:"""
         
         return ChatPromptTemplate.from_template(template)
     
-    def get_retriever(self, k: int = 5, use_hybrid: bool = True):
+    def get_retriever(self, k: int = 5, use_hybrid: bool = True, fetch_k: int = None):
         """
         Get retriever from vector store with user-specific filtering.
         
         Args:
             k: Number of documents to retrieve
             use_hybrid: If True and available, use hybrid BM25+semantic search
+            fetch_k: Candidates per leg before hybrid fusion (default from settings)
         """
         vector_store = self.vector_store_manager.load_vector_store()
         
-        # Base vector retriever with user filtering
-        if self.user_id is not None:
+        # Base vector retriever with user filtering (not needed for a per-user collection)
+        search_filter = self.vector_store_manager.search_filter
+        if search_filter is not None:
             vector_retriever = vector_store.as_retriever(
                 search_kwargs={
                     "k": k,
-                    "filter": {"user_id": str(self.user_id)}
+                    "filter": search_filter
                 }
             )
         else:
@@ -378,7 +613,9 @@ Answer:"""
                     vector_retriever=vector_retriever,
                     user_id=self.user_id,
                     semantic_weight=0.6,
-                    bm25_weight=0.4
+                    bm25_weight=0.4,
+                    k=k,
+                    fetch_k=fetch_k
                 )
                 print(f"Using hybrid retriever (60% semantic, 40% BM25)")
                 return hybrid_retriever
@@ -388,55 +625,232 @@ Answer:"""
         
         return vector_retriever
     
+    @staticmethod
+    def format_docs(docs: List[LangchainDocument]) -> str:
+        """Render retrieved chunks as the prompt context."""
+        return "\n\n".join(
+            f"[Source: {doc.metadata.get('source', 'unknown')}]\n{doc.page_content}"
+            for doc in docs
+        )
+    
+    @staticmethod
+    def build_citations(docs: List[LangchainDocument]) -> List[Dict[str, Any]]:
+        """Turn retrieved chunks into the citations returned to the client."""
+        citations = []
+        for doc in docs:
+            source = Path(doc.metadata.get("source", "unknown")).name
+            content = doc.page_content.strip()
+            citations.append({
+                "source": source,
+                "content": content,
+                "page": doc.metadata.get("page", None),
+                "chunk_id": doc.metadata.get("chunk_id", None)
+            })
+        return citations
+    
+    def build_answer_chain(self):
+        """Build the generation half of the chain: {context, question} -> answer."""
+        return self.build_prompt() | self.llm | StrOutputParser()
+    
     def build_chain(self):
         """Build the complete RAG chain."""
         retriever = self.get_retriever()
-        prompt = self.build_prompt()
-        
-        def format_docs(docs):
-            return "\n\n".join(
-                f"[Source: {doc.metadata.get('source', 'unknown')}]\n{doc.page_content}"
-                for doc in docs
-            )
+        answer_chain = self.build_answer_chain()
         
         chain = (
-            {"context": retriever | format_docs, "question": RunnablePassthrough()}
-            | prompt
-            | self.llm
-            | StrOutputParser()
+            {"context": retriever | self.format_docs, "question": RunnablePassthrough()}
+            | answer_chain
         )
         
         return {
             "chain": chain,
-            "retriever": retriever
+            "retriever": retriever,
+            "answer_chain": answer_chain
         }
     
-    def query(self, question: str) -> Dict[str, Any]:
-        """Execute a RAG query and return response with citations."""
-        rag_result = self.build_chain()
-        chain = rag_result["chain"]
-        retriever = rag_result["retriever"]
+    def _get_runnables(self):
+        """Default retriever and answer chain, built once per engine."""
+        if self._answer_chain is None:
+            with self._build_lock:
+                if self._answer_chain is None:
+                    self._retriever = self.get_retriever(k=self.RETRIEVAL_K)
+                    self._answer_chain = self.build_answer_chain()
+        return self._retriever, self._answer_chain
+    
+    def retrieve(self, question: str) -> List[LangchainDocument]:
+        """
+        Retrieve chunks for a question, reusing cached rankings.
+        
+        The retrieval cache maps (user, normalized query, k, index version) to
+        ranked chunk ids, so a repeated question skips the query embedding and
+        both searches and only fetches the chunks by id.
+        """
+        retriever, _ = self._get_runnables()
+        if not RETRIEVAL_CACHE_ENABLED or self.index_version is None:
+            return retriever.invoke(question)
+        
+        key = retrieval_cache_key(self.user_id, question, self.RETRIEVAL_K, self.index_version)
+        chunk_ids = RETRIEVAL_CACHE.get(key)
+        if chunk_ids:
+            try:
+                docs = self.vector_store_manager.get_chunks_by_ids(chunk_ids)
+                if len(docs) == len(chunk_ids):
+                    return docs
+            except Exception as e:
+                print(f"Retrieval cache: chunk lookup failed: {e}")
         
-        # Get source documents for citations
         docs = retriever.invoke(question)
-        citations = []
+        chunk_ids = [doc.metadata.get('chunk_id') for doc in docs]
+        if docs and all(chunk_ids):
+            RETRIEVAL_CACHE.set(key, chunk_ids)
+        return docs
+    
+    def _lookup_answer(self, question: str):
+        """
+        Check the answer cache.
         
-        for doc in docs:
-            source = Path(doc.metadata.get("source", "unknown")).name
-            content = doc.page_content.strip()
-            citations.append({
-                "source": source,
-                "content": content,
-                "page": doc.metadata.get("page", None)
-            })
+        Returns:
+            (cached result or None, query embedding to store a fresh answer under)
+        """
+        if self.answer_cache is None:
+            return None, None
+        try:
+            result = self.answer_cache.get_exact(question)
+            if result is not None:
+                return result, None
+            query_embedding = self.answer_cache.embed(question)
+            return self.answer_cache.get_similar(query_embedding), query_embedding
+        except Exception as e:
+            print(f"Answer cache lookup failed: {e}")
+            return None, None
+    
+    def _store_answer(self, question: str, result: Dict[str, Any], query_embedding) -> None:
+        if self.answer_cache is None:
+            return
+        try:
+            self.answer_cache.put(question, result, query_embedding)
+        except Exception as e:
+            print(f"Answer cache store failed: {e}")
+    
+    def query(self, question: str) -> Dict[str, Any]:
+        """
+        Execute a RAG query and return response with citations.
         
-        # Generate answer
-        response = chain.invoke(question)
+        Retrieval runs once: the same chunks feed the prompt context and the
+        returned citations. Repeated (or near-identical) questions against the
+        same knowledge base are answered from the answer cache.
+        """
+        cached, query_embedding = self._lookup_answer(question)
+        if cached is not None:
+            return cached
         
-        return {
+        _, answer_chain = self._get_runnables()
+        docs = self.retrieve(question)
+        
+        # Generate answer from the already-retrieved context
+        response = answer_chain.invoke({
+            "context": self.format_docs(docs),
+            "question": question
+        })
+        
+        result = {
             "response": response,
-            "citations": citations
+            "citations": self.build_citations(docs)
         }
+        self._store_answer(question, result, query_embedding)
+        return result
+    
+    def stream(self, question: str) -> Iterator[Dict[str, Any]]:
+        """
+        Execute a RAG query incrementally.
+        
+        Yields a {"type": "citations"} event as soon as retrieval finishes,
+        then one {"type": "token", "content": ...} event per generated delta.
+        A cached answer is emitted as a single token event.
+        """
+        cached, query_embedding = self._lookup_answer(question)
+        if cached is not None:
+            yield {"type": "citations", "citations": cached["citations"]}
+            yield {"type": "token", "content": cached["response"]}
+            return
+        
+        _, answer_chain = self._get_runnables()
+        docs = self.retrieve(question)
+        citations = self.build_citations(docs)
+        yield {"type": "citations", "citations": citations}
+        
+        parts = []
+        for delta in answer_chain.stream({
+            "context": self.format_docs(docs),
+            "question": question
+        }):
+            if delta:
+                parts.append(delta)
+                yield {"type": "token", "content": delta}
+        
+        self._store_answer(question, {"response": "".join(parts), "citations": citations}, query_embedding)
+
+
+# Process-level pool of warm engines, keyed by (user, prompt, knowledge base version)
+_ENGINE_POOL: "OrderedDict[tuple, RAGEngine]" = OrderedDict()
+_ENGINE_POOL_LOCK = threading.Lock()
+
+
+def get_knowledge_base_version(user_id: int = None) -> str:
+    """
+    Cheap fingerprint of a user's indexed documents.
+    
+    Changes whenever a document finishes indexing (in any process), is
+    deleted, or the knowledge base is reset.
+    """
+    from django.db.models import Count, Max
+    from api.models import Document
+    
+    stats = Document.objects.filter(user_id=user_id, index_status='indexed').aggregate(
+        count=Count('id'), latest=Max('indexed_at')
+    )
+    latest = stats['latest'].isoformat() if stats['latest'] else ''
+    return f"{stats['count']}:{latest}"
+
+
+def get_rag_engine(user_id: int = None, custom_prompt: Optional[str] = None) -> RAGEngine:
+    """
+    Get a pooled RAGEngine for a user and their active system prompt.
+    
+    Engines are keyed by user, prompt text and knowledge base version, so a
+    change to either the prompt or the indexed documents yields a fresh
+    engine; the user's superseded engines are dropped at that point. The pool
+    is an LRU bounded by RAG_ENGINE_POOL_SIZE.
+    """
+    index_version = get_knowledge_base_version(user_id)
+    key = (user_id, custom_prompt or '', index_version)
+    
+    with _ENGINE_POOL_LOCK:
+        engine = _ENGINE_POOL.get(key)
+        if engine is not None:
+            _ENGINE_POOL.move_to_end(key)
+            return engine
+    
+    engine = RAGEngine(custom_prompt=custom_prompt, user_id=user_id, index_version=index_version)
+    
+    with _ENGINE_POOL_LOCK:
+        for stale_key in [k for k in _ENGINE_POOL if k[0] == user_id]:
+            del _ENGINE_POOL[stale_key]
+        _ENGINE_POOL[key] = engine
+        while len(_ENGINE_POOL) > RAG_ENGINE_POOL_SIZE:
+            _ENGINE_POOL.popitem(last=False)
+    
+    return engine
+
+
+def invalidate_rag_engines(user_id: int = None) -> None:
+    """Drop pooled engines for a user (or all users when user_id is None)."""
+    with _ENGINE_POOL_LOCK:
+        if user_id is None:
+            _ENGINE_POOL.clear()
+            return
+        for key in [k for k in _ENGINE_POOL if k[0] == user_id]:
+            del _ENGINE_POOL[key]
 
 
 # Convenience functions for backward compatibility
@@ -446,7 +860,7 @@ def load_and_chunk_documents(directory: str = None) -> List:
     return processor.load_all_documents(directory)
 
 
-def get_vector_store(chunks: List = None, user_id: int = None) -> Chroma:
+def get_vector_store(chunks: List = None, user_id: int = None) -> VectorStore:
     """Get or create vector store."""
     manager = VectorStoreManager(user_id=user_id)
     return manager.get_or_create_vector_store(chunks)
@@ -0,0 +1,107 @@
+"""
+On-disk Storage Helpers for KnowBot 2.0
+
+Primitives shared by the file-backed stores (bm25_store.BM25SegmentStore and
+vector_backends.NumpyCollection), which publish immutable files through a
+small manifest that many processes read while one writer at a time updates it:
+- atomic_write: temp file + rename, so readers never see a partial file
+- file_stamp: cheap change detector for a file replaced by atomic_write
+- exclusive_lock: cross-process advisory lock serializing writers
+
+and SQLiteCache, the base of the SQLite caches on the shared volume
+(embeddings.EmbeddingCache and ocr.OCRCache).
+"""
+
+import fcntl
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+
+def atomic_write(path: Path, data: bytes) -> None:
+    """Write data to path via a temp file + rename so readers never see partial files."""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def file_stamp(path: Path) -> Optional[tuple]:
+    """(inode, mtime_ns, size) of a file, or None if it doesn't exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    # os.replace gives every atomic_write a new inode, even within one mtime tick
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+@contextmanager
+def exclusive_lock(lock_path: Path) -> Iterator[None]:
+    """Hold an exclusive flock on lock_path (created if missing) for the block."""
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class SQLiteCache:
+    """
+    SQLite database shared by the Celery worker and web processes, with LRU eviction.
+
+    Subclasses create their table in _create_schema; it must have an indexed
+    last_used column, which they update on reads and writes. When the table
+    grows past max_entries, the least recently used tenth is evicted.
+    """
+
+    table = ''
+    label = 'Cache'
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self._local = threading.local()
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            self._create_schema(conn)
+
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        raise NotImplementedError
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections aren't shareable)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        count = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        # Evict down to 90% of the budget so we don't evict on every insert
+        excess = count - int(self.max_entries * 0.9)
+        with conn:
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE rowid IN ("
+                f" SELECT rowid FROM {self.table} ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+        print(f"{self.label} evicted {excess} entries")
@@ -0,0 +1,713 @@
+"""
+Vector Storage Backends for KnowBot 2.0
+
+VectorStoreManager stores and searches chunk vectors through a VectorBackend:
+- ChromaBackend: chromadb collections (local PersistentClient or the chromadb service)
+- NumpyBackend: in-process exact (flat) or IVF search with NumPy over
+  memory-mapped float16/int8 vectors, so small and medium tenants skip the
+  network round-trip to chromadb entirely
+
+The backend is selected per deployment with settings.VECTOR_BACKEND.
+
+NumPy collection layout (one directory per collection under settings.VECTOR_DIR):
+    MANIFEST.json           {"generation", "dim", "dtype", "count", "rows_bytes", "deleted"}
+    vectors-00000001.bin    count x dim unit-normalized vectors (float16, or int8)
+    scales-00000001.bin     float32 dequantization scale per row (int8 only)
+    rows-00000001.jsonl     id, document and metadata of each row, in row order
+    .lock                   advisory lock serializing writers
+
+Writers append rows and then atomically publish the new row count in the
+manifest, so readers never see a partial row. Upserting an existing id
+tombstones its old row; compaction rewrites the live rows as a new generation.
+"""
+
+import json
+import math
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from rag.storage import atomic_write, exclusive_lock, file_stamp
+
+
+VECTOR_BACKEND = getattr(settings, 'VECTOR_BACKEND', 'chroma')  # chroma, numpy
+VECTOR_DIR = str(getattr(settings, 'VECTOR_DIR', './vector_index'))
+NUMPY_VECTOR_DTYPE = getattr(settings, 'NUMPY_VECTOR_DTYPE', 'float16')  # float16, int8
+NUMPY_VECTOR_INDEX = getattr(settings, 'NUMPY_VECTOR_INDEX', 'flat')  # flat, ivf
+# IVF is only built for collections with at least this many live rows
+NUMPY_IVF_MIN_ROWS = int(getattr(settings, 'NUMPY_IVF_MIN_ROWS', 20000))
+NUMPY_IVF_NPROBE = int(getattr(settings, 'NUMPY_IVF_NPROBE', 32))
+# Rewrite a collection once this fraction of its rows is tombstoned
+NUMPY_COMPACTION_RATIO = float(getattr(settings, 'NUMPY_COMPACTION_RATIO', 0.3))
+
+MANIFEST_NAME = 'MANIFEST.json'
+LOCK_NAME = '.lock'
+# Rows scored per NumPy block, bounding the temporary float32 copy
+SCORE_BLOCK_ROWS = 65536
+
+
+def matches_filter(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """
+    Evaluate a Chroma-style metadata filter.
+
+    Supports {"key": value}, {"key": {"$eq"|"$ne"|"$in"|"$nin": ...}},
+    {"$and": [...]} and {"$or": [...]}.
+    """
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, c) for c in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, c) for c in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            if "$eq" in condition and value != condition["$eq"]:
+                return False
+            if "$ne" in condition and value == condition["$ne"]:
+                return False
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+            if "$nin" in condition and value in condition["$nin"]:
+                return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+class VectorBackend:
+    """Storage and search for one collection of chunk vectors."""
+
+    def create(self) -> None:
+        """Make sure the collection exists."""
+        raise NotImplementedError
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]],
+               documents: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Insert or replace chunks by id with precomputed embeddings."""
+        raise NotImplementedError
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None) -> None:
+        """Delete chunks by id and/or metadata filter."""
+        raise NotImplementedError
+
+    def get(self, ids: List[str]) -> List[Document]:
+        """Fetch chunks by id, in the given order (missing ids are skipped)."""
+        raise NotImplementedError
+
+    def drop(self) -> None:
+        """Delete the whole collection."""
+        raise NotImplementedError
+
+    def as_vectorstore(self) -> VectorStore:
+        """LangChain VectorStore over this collection (for retrievers)."""
+        raise NotImplementedError
+
+
+class ChromaBackend(VectorBackend):
+    """A chromadb collection, through the shared client from rag.service."""
+
+    def __init__(self, client, collection_name: str, embeddings: Embeddings):
+        self.client = client
+        self.collection_name = collection_name
+        self.embeddings = embeddings
+
+    def as_vectorstore(self) -> VectorStore:
+        from langchain_chroma import Chroma
+        return Chroma(
+            client=self.client,
+            collection_name=self.collection_name,
+            embedding_function=self.embeddings,
+        )
+
+    def create(self) -> None:
+        # langchain's Chroma wrapper creates the collection with its defaults
+        self.as_vectorstore()
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        self.client.get_collection(self.collection_name).upsert(
+            ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas
+        )
+
+    def delete(self, ids=None, where=None) -> None:
+        self.client.get_collection(self.collection_name).delete(ids=ids, where=where)
+
+    def get(self, ids: List[str]) -> List[Document]:
+        collection = self.client.get_collection(self.collection_name)
+        result = collection.get(ids=list(ids), include=["documents", "metadatas"])
+        by_id = {
+            chunk_id: Document(id=chunk_id, page_content=content or "", metadata=metadata or {})
+            for chunk_id, content, metadata in zip(result["ids"], result["documents"], result["metadatas"])
+        }
+        return [by_id[chunk_id] for chunk_id in ids if chunk_id in by_id]
+
+    def drop(self) -> None:
+        self.client.delete_collection(self.collection_name)
+
+
+class NumpyCollection:
+    """
+    One on-disk NumPy vector collection plus this process's view of it.
+
+    Shared by every NumpyBackend of the collection in the process (see
+    get_numpy_collection); the view is refreshed from the manifest before
+    each read, loading only rows appended since the last refresh.
+    """
+
+    def __init__(self, directory: Path, dtype: str = NUMPY_VECTOR_DTYPE):
+        if dtype not in ('float16', 'int8'):
+            raise ValueError(f"Unsupported NumPy vector dtype: {dtype}")
+        self.directory = Path(directory)
+        self.manifest_path = self.directory / MANIFEST_NAME
+        self.dtype = dtype
+        self._lock = threading.RLock()
+        self._stamp = None
+        self._view_id = 0
+        self._ivf_building = False
+        self._clear_view()
+
+    def _clear_view(self) -> None:
+        self._manifest: Optional[Dict[str, Any]] = None
+        self._vectors: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._row_of: Dict[str, int] = {}
+        self._live = np.zeros(0, dtype=bool)
+        self._filter_masks: Dict[str, np.ndarray] = {}
+        self._ivf = None
+        self._rows_identity: Optional[tuple] = None
+        # Lets an IVF built in the background detect that the view was replaced
+        self._view_id += 1
+
+    # ---- files ----
+
+    @staticmethod
+    def _file_names(generation: int) -> Dict[str, str]:
+        return {
+            "vectors": f"vectors-{generation:08d}.bin",
+            "scales": f"scales-{generation:08d}.bin",
+            "rows": f"rows-{generation:08d}.jsonl",
+        }
+
+    def _manifest_stamp(self) -> Optional[tuple]:
+        return file_stamp(self.manifest_path)
+
+    def read_manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.manifest_path, 'rb') as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        """Exclusive advisory lock across processes, plus the in-process lock."""
+        with self._lock, exclusive_lock(self.directory / LOCK_NAME):
+            yield
+
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        atomic_write(self.manifest_path, json.dumps(manifest).encode('utf-8'))
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Unit-normalize and quantize rows to the collection dtype."""
+        vectors = _normalize(vectors.astype(np.float32))
+        if self.dtype == 'float16':
+            return vectors.astype(np.float16), None
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales = np.where(scales == 0, 1.0, scales).astype(np.float32)
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales
+
+    # ---- reading ----
+
+    def refresh(self) -> None:
+        """Bring this process's view up to date with the manifest."""
+        stamp = self._manifest_stamp()
+        if stamp == self._stamp:
+            return
+        with self._lock:
+            stamp = self._manifest_stamp()
+            if stamp == self._stamp:
+                return
+            manifest = self.read_manifest()
+            if manifest is None:
+                self._clear_view()
+                self._stamp = stamp
+                return
+            try:
+                self._load(manifest)
+            except FileNotFoundError:
+                # Compacted between reading the manifest and its files; start over
+                self._clear_view()
+                self._stamp = None
+                return self.refresh()
+            self._stamp = stamp
+
+    def _load(self, manifest: Dict[str, Any]) -> None:
+        """Map the manifest's vectors and read rows appended since the last load."""
+        loaded = self._manifest
+        if (loaded is None or loaded["generation"] != manifest["generation"]
+                or loaded["count"] > manifest["count"]):
+            self._clear_view()
+            loaded = None
+
+        names = self._file_names(manifest["generation"])
+        rows_path = self.directory / names["rows"]
+        # A rows file replaced under the same name must never be read incrementally
+        rows_identity = None
+        if manifest["count"]:
+            stat = os.stat(rows_path)
+            rows_identity = (stat.st_dev, stat.st_ino)
+        if loaded is not None and rows_identity != self._rows_identity:
+            self._clear_view()
+            loaded = None
+        self._rows_identity = rows_identity
+
+        count, dim = manifest["count"], manifest["dim"]
+        dtype = np.float16 if manifest["dtype"] == 'float16' else np.int8
+        if count:
+            # Map only the published prefix; a writer may be appending past it
+            self._vectors = np.memmap(self.directory / names["vectors"], dtype=dtype,
+                                      mode='r', shape=(count, dim))
+            if manifest["dtype"] == 'int8':
+                self._scales = np.memmap(self.directory / names["scales"], dtype=np.float32,
+                                         mode='r', shape=(count,))
+
+        # Load the rows appended since the last refresh
+        start = loaded["rows_bytes"] if loaded else 0
+        data = b''
+        if manifest["rows_bytes"] > start:
+            with open(rows_path, 'rb') as f:
+                f.seek(start)
+                data = f.read(manifest["rows_bytes"] - start)
+        for line in data.splitlines():
+            if line.strip():
+                row = json.loads(line)
+                self._row_of[row["id"]] = len(self._ids)
+                self._ids.append(row["id"])
+                self._documents.append(row["document"])
+                self._metadatas.append(row["metadata"])
+
+        live = np.ones(count, dtype=bool)
+        if manifest["deleted"]:
+            live[np.asarray(manifest["deleted"], dtype=np.int64)] = False
+        self._live = live
+        self._filter_masks = {}
+        self._manifest = manifest
+
+    def __len__(self) -> int:
+        self.refresh()
+        return int(self._live.sum())
+
+    def get(self, ids: List[str]) -> List[Document]:
+        self.refresh()
+        with self._lock:
+            rows = [self._row_of.get(chunk_id) for chunk_id in ids]
+            return [self._document(row) for row in rows if row is not None and self._live[row]]
+
+    def _document(self, row: int) -> Document:
+        return Document(id=self._ids[row], page_content=self._documents[row],
+                        metadata=dict(self._metadatas[row]))
+
+    def _filter_mask(self, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        """Live rows matching the filter (cached per filter until the next refresh)."""
+        if not where:
+            return self._live
+        key = json.dumps(where, sort_keys=True, default=str)
+        mask = self._filter_masks.get(key)
+        if mask is None:
+            mask = self._live & np.fromiter(
+                (matches_filter(metadata, where) for metadata in self._metadatas),
+                dtype=bool, count=len(self._metadatas)
+            )
+            self._filter_masks[key] = mask
+        return mask
+
+    @staticmethod
+    def _score(vectors: np.ndarray, scales: Optional[np.ndarray],
+               rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Cosine similarity of the given rows to a unit query vector."""
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+            block = rows[start:start + SCORE_BLOCK_ROWS]
+            block_scores = vectors[block].astype(np.float32) @ query
+            if scales is not None:
+                block_scores *= scales[block]
+            scores[start:start + SCORE_BLOCK_ROWS] = block_scores
+        return scores
+
+    def search(self, embedding: List[float], k: int = 4,
+               where: Optional[Dict[str, Any]] = None) -> List[Tuple[Document, float]]:
+        """
+        Top-k rows by cosine similarity.
+
+        Args:
+            embedding: Query vector
+            k: Number of results
+            where: Optional Chroma-style metadata filter
+
+        Returns:
+            (Document, cosine similarity) pairs, best first
+        """
+        self.refresh()
+        # Snapshot the view under the lock and score outside it, so concurrent
+        # queries (every user's, in the shared layout) don't serialize. A
+        # refresh replaces these objects rather than mutating them in place.
+        with self._lock:
+            if self._vectors is None:
+                return []
+            vectors, scales = self._vectors, self._scales
+            ids, documents, metadatas = self._ids, self._documents, self._metadatas
+            mask = self._filter_mask(where)
+            ivf = self._ivf_for_query(len(mask)) if NUMPY_VECTOR_INDEX == 'ivf' else None
+
+        query = _normalize(np.asarray(embedding, dtype=np.float32))
+        candidates = np.flatnonzero(mask)
+        if ivf is not None and len(candidates) >= NUMPY_IVF_MIN_ROWS:
+            probed = self._ivf_candidates(ivf, query, len(mask))
+            candidates = probed[mask[probed]]
+        if not len(candidates):
+            return []
+
+        scores = self._score(vectors, scales, candidates, query)
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        results = []
+        for i in top:
+            row = int(candidates[i])
+            doc = Document(id=ids[row], page_content=documents[row], metadata=dict(metadatas[row]))
+            results.append((doc, float(scores[i])))
+        return results
+
+    # ---- IVF ----
+
+    def _ivf_for_query(self, count: int) -> Optional[Dict[str, Any]]:
+        """
+        The IVF to search with (lock held), scheduling a rebuild when it is
+        missing or too far behind. Until one is ready, queries scan exactly.
+        """
+        ivf = self._ivf
+        if ivf is None or count - ivf["built_count"] > 0.2 * ivf["built_count"]:
+            if int(self._live.sum()) >= NUMPY_IVF_MIN_ROWS:
+                self._schedule_ivf_build()
+        return ivf
+
+    def _schedule_ivf_build(self) -> None:
+        """Build the IVF on a background thread (lock held); at most one at a time."""
+        if self._ivf_building:
+            return
+        self._ivf_building = True
+        snapshot = (self._view_id, self._vectors, self._live)
+        threading.Thread(target=self._build_ivf, args=snapshot,
+                         name='numpy-ivf-build', daemon=True).start()
+
+    def _build_ivf(self, view_id: int, vectors: np.ndarray, live: np.ndarray) -> None:
+        """Spherical k-means over the live rows; rows appended later are scanned exactly."""
+        try:
+            ivf = self._kmeans_ivf(vectors, live)
+            with self._lock:
+                # Drop it if a compaction or drop replaced the view meanwhile
+                if view_id == self._view_id:
+                    self._ivf = ivf
+            print(f"Built IVF index for {self.directory.name}: "
+                  f"{int(live.sum())} rows, {len(ivf['lists'])} lists")
+        except Exception as e:
+            print(f"IVF build failed for {self.directory.name}: {e}")
+        finally:
+            with self._lock:
+                self._ivf_building = False
+
+    @staticmethod
+    def _kmeans_ivf(vectors: np.ndarray, live: np.ndarray) -> Dict[str, Any]:
+        live_rows = np.flatnonzero(live)
+        nlist = max(1, min(1024, int(math.sqrt(len(live_rows)))))
+        rng = np.random.default_rng(0)
+        sample = rng.choice(live_rows, size=min(len(live_rows), 64 * nlist), replace=False)
+        sample_vectors = vectors[np.sort(sample)].astype(np.float32)
+        centroids = sample_vectors[rng.choice(len(sample_vectors), size=nlist, replace=False)]
+        for _ in range(10):
+            assignment = np.argmax(sample_vectors @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample_vectors[assignment == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+
+        assignment = np.empty(len(live_rows), dtype=np.int64)
+        for start in range(0, len(live_rows), SCORE_BLOCK_ROWS):
+            block = live_rows[start:start + SCORE_BLOCK_ROWS]
+            assignment[start:start + SCORE_BLOCK_ROWS] = np.argmax(
+                vectors[block].astype(np.float32) @ centroids.T, axis=1
+            )
+        order = np.argsort(assignment, kind='stable')
+        bounds = np.searchsorted(assignment[order], np.arange(nlist + 1))
+        lists = [live_rows[order[bounds[c]:bounds[c + 1]]] for c in range(nlist)]
+        return {"centroids": centroids, "lists": lists, "built_count": len(live)}
+
+    @staticmethod
+    def _ivf_candidates(ivf: Dict[str, Any], query: np.ndarray, count: int) -> np.ndarray:
+        """Rows in the nprobe closest lists, plus rows added since the IVF was built."""
+        nprobe = min(NUMPY_IVF_NPROBE, len(ivf["lists"]))
+        nearest = np.argpartition(-(ivf["centroids"] @ query), nprobe - 1)[:nprobe]
+        tail = np.arange(ivf["built_count"], count)
+        return np.concatenate([ivf["lists"][c] for c in nearest] + [tail])
+
+    # ---- writing ----
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]],
+               documents: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Append rows, tombstoning earlier rows with the same ids."""
+        if not ids:
+            return
+        payload = "".join(
+            json.dumps({"id": chunk_id, "document": document, "metadata": metadata or {}}, default=str) + "\n"
+            for chunk_id, document, metadata in zip(ids, documents, metadatas)
+        ).encode('utf-8')
+
+        with self._write_lock():
+            manifest = self.read_manifest()
+            dim = len(embeddings[0])
+            if manifest is None:
+                manifest = {"generation": 1, "dim": dim, "dtype": self.dtype,
+                            "count": 0, "rows_bytes": 0, "deleted": []}
+            elif not manifest["count"]:
+                # Empty (e.g. dropped) collections take the current dimension and dtype
+                manifest.update(dim=dim, dtype=self.dtype)
+            if manifest["dim"] != dim:
+                raise ValueError(f"Embedding dimension {dim} does not match collection ({manifest['dim']})")
+            # An existing collection keeps the dtype it was created with
+            self.dtype = manifest["dtype"]
+            vectors, scales = self._encode(np.asarray(embeddings, dtype=np.float32))
+
+            # Tombstone the rows being replaced
+            self.refresh()
+            replaced = {self._row_of[chunk_id] for chunk_id in ids if chunk_id in self._row_of}
+            deleted = set(manifest["deleted"])
+            manifest["deleted"] = sorted(deleted | {row for row in replaced if row not in deleted})
+
+            names = self._file_names(manifest["generation"])
+            count = manifest["count"]
+            row_size = vectors.shape[1] * vectors.dtype.itemsize
+            # Drop anything an interrupted writer left past the published rows
+            self._append(names["vectors"], count * row_size, vectors.tobytes())
+            if scales is not None:
+                self._append(names["scales"], count * 4, scales.tobytes())
+            self._append(names["rows"], manifest["rows_bytes"], payload)
+
+            manifest["count"] = count + len(ids)
+            manifest["rows_bytes"] += len(payload)
+            self._write_manifest(manifest)
+
+        self.maybe_compact()
+
+    def _append(self, name: str, published_size: int, data: bytes) -> None:
+        path = self.directory / name
+        with open(path, 'ab') as f:
+            f.truncate(published_size)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None) -> int:
+        """Tombstone rows by id and/or metadata filter; returns the number deleted."""
+        with self._write_lock():
+            manifest = self.read_manifest()
+            if manifest is None:
+                return 0
+            self.refresh()
+            if ids is not None:
+                rows = {self._row_of[chunk_id] for chunk_id in ids if chunk_id in self._row_of}
+                if where:
+                    rows = {row for row in rows if matches_filter(self._metadatas[row], where)}
+            elif where:
+                rows = set(np.flatnonzero(self._filter_mask(where)).tolist())
+            else:
+                return 0
+
+            deleted = set(manifest["deleted"])
+            rows = {row for row in rows if row not in deleted}
+            if not rows:
+                return 0
+            manifest["deleted"] = sorted(deleted | rows)
+            self._write_manifest(manifest)
+
+        self.maybe_compact()
+        return len(rows)
+
+    def drop(self) -> None:
+        """Delete every row and file of the collection."""
+        with self._write_lock():
+            manifest = self.read_manifest()
+            if manifest is None:
+                return
+            # Publish an empty next generation rather than removing the manifest,
+            # so file names never repeat and other processes' views reset cleanly
+            self._write_manifest({
+                "generation": manifest["generation"] + 1, "dim": manifest["dim"],
+                "dtype": manifest["dtype"], "count": 0, "rows_bytes": 0, "deleted": [],
+            })
+            self._remove_generation(manifest["generation"])
+
+    def _remove_generation(self, generation: int) -> None:
+        for name in self._file_names(generation).values():
+            try:
+                os.unlink(self.directory / name)
+            except FileNotFoundError:
+                pass
+
+    def maybe_compact(self) -> bool:
+        manifest = self.read_manifest()
+        if manifest and manifest["count"] and len(manifest["deleted"]) / manifest["count"] >= NUMPY_COMPACTION_RATIO:
+            self.compact()
+            return True
+        return False
+
+    def compact(self) -> None:
+        """Rewrite the live rows as a new generation and drop the old files."""
+        with self._write_lock():
+            manifest = self.read_manifest()
+            if manifest is None:
+                return
+            self.refresh()
+            live_rows = np.flatnonzero(self._live)
+            generation = manifest["generation"] + 1
+            names = self._file_names(generation)
+
+            payload = "".join(
+                json.dumps({"id": self._ids[row], "document": self._documents[row],
+                            "metadata": self._metadatas[row]}, default=str) + "\n"
+                for row in live_rows
+            ).encode('utf-8')
+            vectors = np.ascontiguousarray(self._vectors[live_rows]) if len(live_rows) else b''
+            atomic_write(self.directory / names["vectors"], bytes(vectors))
+            if manifest["dtype"] == 'int8':
+                scales = np.ascontiguousarray(self._scales[live_rows]) if len(live_rows) else b''
+                atomic_write(self.directory / names["scales"], bytes(scales))
+            atomic_write(self.directory / names["rows"], payload)
+
+            self._write_manifest({
+                "generation": generation, "dim": manifest["dim"], "dtype": manifest["dtype"],
+                "count": len(live_rows), "rows_bytes": len(payload), "deleted": [],
+            })
+            self._remove_generation(manifest["generation"])
+
+        print(f"Compacted vector collection {self.directory.name}: "
+              f"{manifest['count']} rows -> {len(live_rows)} live rows")
+
+
+_NUMPY_COLLECTIONS: Dict[str, NumpyCollection] = {}
+_NUMPY_COLLECTIONS_LOCK = threading.Lock()
+
+
+def get_numpy_collection(collection_name: str, base_dir: str = VECTOR_DIR) -> NumpyCollection:
+    """Process-wide NumpyCollection per collection directory."""
+    directory = Path(base_dir) / collection_name
+    with _NUMPY_COLLECTIONS_LOCK:
+        key = str(directory)
+        if key not in _NUMPY_COLLECTIONS:
+            _NUMPY_COLLECTIONS[key] = NumpyCollection(directory)
+        return _NUMPY_COLLECTIONS[key]
+
+
+class NumpyVectorStore(VectorStore):
+    """LangChain VectorStore over a NumpyCollection (cosine similarity)."""
+
+    def __init__(self, collection: NumpyCollection, embedding: Embeddings):
+        self.collection = collection
+        self._embedding = embedding
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        ids = [chunk_id or str(uuid.uuid4()) for chunk_id in (ids or [None] * len(texts))]
+        metadatas = metadatas or [{} for _ in texts]
+        self.collection.upsert(ids, self._embedding.embed_documents(texts), texts, metadatas)
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        self.collection.delete(ids=ids, where=kwargs.get('where'))
+        return True
+
+    def get_by_ids(self, ids: List[str], /) -> List[Document]:
+        return self.collection.get(ids)
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[Dict[str, Any]] = None,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.collection.search(embedding, k=k, where=filter)
+
+    def similarity_search_with_score(self, query: str, k: int = 4,
+                                     filter: Optional[Dict[str, Any]] = None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k, filter)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4,
+                                    filter: Optional[Dict[str, Any]] = None,
+                                    **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def similarity_search(self, query: str, k: int = 4,
+                          filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        # Cosine similarity in [-1, 1] -> relevance in [0, 1]
+        return lambda score: (1.0 + score) / 2.0
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   *, ids: Optional[List[str]] = None, collection_name: str = 'knowbot_docs',
+                   **kwargs: Any) -> 'NumpyVectorStore':
+        store = cls(get_numpy_collection(collection_name), embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+
+class NumpyBackend(VectorBackend):
+    """In-process NumPy collection (see NumpyCollection)."""
+
+    def __init__(self, collection_name: str, embeddings: Embeddings, base_dir: str = VECTOR_DIR):
+        self.collection_name = collection_name
+        self.embeddings = embeddings
+        self.collection = get_numpy_collection(collection_name, base_dir)
+
+    def create(self) -> None:
+        # Files are created on the first upsert
+        pass
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        self.collection.upsert(ids, embeddings, documents, metadatas)
+
+    def delete(self, ids=None, where=None) -> None:
+        self.collection.delete(ids=ids, where=where)
+
+    def get(self, ids: List[str]) -> List[Document]:
+        return self.collection.get(ids)
+
+    def drop(self) -> None:
+        self.collection.drop()
+
+    def as_vectorstore(self) -> VectorStore:
+        return NumpyVectorStore(self.collection, self.embeddings)